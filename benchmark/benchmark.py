@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Benchmark the integration against a fleet of emulated Midea AC devices."""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from homeassistant import auth, config_entries, loader
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry, device_registry, entity, entity_registry, restore_state)
+from homeassistant.setup import async_setup_component
+
+from emulator import Emulator
+
+DOMAIN = "midea_ac"
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ThreadSampler:
+    """Sample the number of live threads in the background."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, threading.active_count())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+def summarize(name: str, latencies: list, duration: float) -> dict:
+    """Compute latency percentiles and throughput of a benchmark phase."""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if count > 1 else latencies * 99
+    return {
+        "phase": name,
+        "count": count,
+        "p50": percentiles[49] if count else 0,
+        "p99": percentiles[98] if count else 0,
+        "max": latencies[-1] if count else 0,
+        "throughput": count / duration if duration else 0,
+    }
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+async def async_start_hass(config_dir: str) -> HomeAssistant:
+    """Start a minimal Home Assistant instance with the integration available."""
+    # Expose the integration as a custom component of the config dir
+    os.makedirs(os.path.join(config_dir, "custom_components"), exist_ok=True)
+    os.symlink(os.path.join(REPO_ROOT, "custom_components", DOMAIN),
+               os.path.join(config_dir, "custom_components", DOMAIN))
+
+    hass = HomeAssistant(config_dir)
+    hass.config.skip_pip = True
+    loader.async_setup(hass)
+    entity.async_setup(hass)
+
+    await asyncio.gather(
+        area_registry.async_load(hass),
+        device_registry.async_load(hass),
+        entity_registry.async_load(hass),
+        restore_state.async_load(hass),
+    )
+
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+
+    # The network dependency of the integration needs the HTTP server, bound to a free local port
+    hass.auth = await auth.auth_manager_from_config(hass, [], [])
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    await async_setup_component(hass, "http", {"http": {"server_host": "127.0.0.1", "server_port": port}})
+
+    await hass.async_start()
+    return hass
+
+
+async def benchmark_setup(hass: HomeAssistant, configs: list) -> dict:
+    """Add every device through the config flow and wait for its entities."""
+    async def setup(config):
+        await hass.config_entries.flow.async_init(
+            DOMAIN, context={"source": config_entries.SOURCE_USER}, data=config)
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[timed(setup(c)) for c in configs])
+    await hass.async_block_till_done()
+    return summarize("setup", latencies, time.perf_counter() - start)
+
+
+async def benchmark_polling(hass: HomeAssistant, rounds: int) -> dict:
+    """Refresh every device concurrently for a number of rounds."""
+    coordinators = list(hass.data[DOMAIN].coordinators.values())
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        latencies += await asyncio.gather(*[timed(c.async_refresh()) for c in coordinators])
+    return summarize("polling", latencies, time.perf_counter() - start)
+
+
+async def benchmark_setters(hass: HomeAssistant, rounds: int) -> dict:
+    """Change mode, temperature and fan speed of every device like a scene would."""
+    registry = entity_registry.async_get(hass)
+    entity_ids = [e.entity_id for e in registry.entities.values()
+                  if e.platform == DOMAIN and e.domain == "climate"]
+
+    async def call(service, data):
+        await hass.services.async_call("climate", service, data, blocking=True)
+
+    async def scene(entity_id, i):
+        await asyncio.gather(
+            call("set_hvac_mode", {"entity_id": entity_id, "hvac_mode": "cool"}),
+            call("set_temperature", {"entity_id": entity_id, "temperature": 20 + i % 8}),
+            call("set_fan_mode", {"entity_id": entity_id, "fan_mode": "High"}),
+        )
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(rounds):
+        latencies += await asyncio.gather(*[timed(scene(e, i)) for e in entity_ids])
+    return summarize("setters", latencies, time.perf_counter() - start)
+
+
+async def main(args) -> list:
+    emulator = Emulator(args.count, args.base_port, args.v3_fraction,
+                        args.latency, args.jitter, args.loss)
+    await emulator.start()
+
+    sampler = ThreadSampler()
+    sampler.start()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_start_hass(config_dir)
+        try:
+            results = [await benchmark_setup(hass, emulator.configs)]
+            results.append(await benchmark_polling(hass, args.rounds))
+            results.append(await benchmark_setters(hass, args.rounds))
+        finally:
+            await hass.async_stop()
+            await emulator.stop()
+            sampler.stop()
+
+    for result in results:
+        result["peak_threads"] = sampler.peak
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark setup, polling and setters against emulated devices")
+    parser.add_argument("-n", "--count", type=int, default=50,
+                        help="number of emulated devices")
+    parser.add_argument("-r", "--rounds", type=int, default=5,
+                        help="number of polling and setter rounds")
+    parser.add_argument("--base-port", type=int, default=16444,
+                        help="port of the first emulated device")
+    parser.add_argument("--v3-fraction", type=float, default=0.5,
+                        help="fraction of devices using the V3 protocol")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01,
+                        help="standard deviation of response latency in seconds")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability a request is never answered")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    parser.add_argument("-d", "--debug", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+
+    results = asyncio.run(main(args))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print("{:<10} {:>6} {:>9} {:>9} {:>9} {:>12} {:>8}".format(
+            "phase", "count", "p50 (s)", "p99 (s)", "max (s)", "ops/s", "threads"))
+        for r in results:
+            print("{phase:<10} {count:>6} {p50:>9.3f} {p99:>9.3f} {max:>9.3f} {throughput:>12.1f} {peak_threads:>8}".format(**r))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Microbenchmark the protocol codec of the integration against msmart."""
+import argparse
+import json
+import os
+import sys
+import time
+
+from msmart.const import MSGTYPE_ENCRYPTED_RESPONSE
+from msmart.device.AC.command import get_state_command, response
+from msmart.packet_builder import packet_builder
+from msmart.security import security
+
+from emulator import EmulatedDevice, codec
+
+DEVICE_ID = 0x10000000000
+
+
+def frames_per_second(func, frames: int, min_time: float) -> float:
+    """Call a function handling a batch of frames until the minimum time has passed."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls * frames / elapsed
+
+
+class _Command:
+    """Prepacked frame for msmart's packet builder."""
+
+    def __init__(self, frame: bytes):
+        self._frame = frame
+
+    def pack(self) -> bytes:
+        return self._frame
+
+
+def cases(batch: int) -> list:
+    """Pairs of msmart and codec functions doing the same work on a batch of frames."""
+    request = get_state_command(0xAC).pack()
+    state = codec.encode_frame(EmulatedDevice(DEVICE_ID, 0, 2, 0, 0, 0).state_payload())
+
+    packets = [codec.encode_packet(DEVICE_ID, state) for _ in range(batch)]
+
+    key = os.urandom(32)
+    msmart_security = security()
+    msmart_security._tcp_key = key
+    session = codec.V3Session(key)
+    messages = b"".join(session.encode(packet, MSGTYPE_ENCRYPTED_RESPONSE) for packet in packets)
+
+    def msmart_encode_v2():
+        for _ in range(batch):
+            builder = packet_builder(DEVICE_ID)
+            builder.set_command(_Command(request))
+            builder.finalize()
+
+    def codec_encode_v2():
+        for _ in range(batch):
+            codec.encode_packet(DEVICE_ID, request)
+
+    def msmart_decode_v2():
+        for packet in packets:
+            msmart_security.aes_decrypt(packet[40:-16])
+
+    def codec_decode_v2():
+        codec.decrypt_packets(packets)
+
+    def msmart_encode_v3():
+        for packet in packets:
+            msmart_security.encode_8370(packet, MSGTYPE_ENCRYPTED_RESPONSE)
+
+    def codec_encode_v3():
+        for packet in packets:
+            session.encode(packet, MSGTYPE_ENCRYPTED_RESPONSE)
+
+    def msmart_decode_v3():
+        msmart_security.decode_8370(messages)
+
+    def codec_decode_v3():
+        session.decode(messages)
+
+    def msmart_decode_state():
+        for packet in packets:
+            response.construct(msmart_security.aes_decrypt(packet[40:-16]))
+
+    def codec_decode_state():
+        codec.decode_states(packets)
+
+    return [
+        ("encode v2", msmart_encode_v2, codec_encode_v2),
+        ("decode v2", msmart_decode_v2, codec_decode_v2),
+        ("encode v3", msmart_encode_v3, codec_encode_v3),
+        ("decode v3", msmart_decode_v3, codec_decode_v3),
+        ("state", msmart_decode_state, codec_decode_state),
+    ]
+
+
+def main(args) -> list:
+    results = []
+    for name, baseline, candidate in cases(args.batch):
+        msmart_rate = frames_per_second(baseline, args.batch, args.min_time)
+        codec_rate = frames_per_second(candidate, args.batch, args.min_time)
+        results.append({
+            "case": name,
+            "batch": args.batch,
+            "msmart": msmart_rate,
+            "codec": codec_rate,
+            "speedup": codec_rate / msmart_rate,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report frames per second encoded and decoded by msmart and the codec")
+    parser.add_argument("-b", "--batch", type=int, default=64,
+                        help="number of frames handled per call")
+    parser.add_argument("-t", "--min-time", type=float, default=1.0,
+                        help="minimum seconds each case runs")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    args = parser.parse_args()
+
+    results = main(args)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print("{:<10} {:>6} {:>14} {:>14} {:>8}".format(
+            "case", "batch", "msmart (f/s)", "codec (f/s)", "speedup"))
+        for r in results:
+            print("{case:<10} {batch:>6} {msmart:>14.0f} {codec:>14.0f} {speedup:>7.2f}x".format(**r))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Emulate a fleet of Midea AC devices speaking the V2 and V3 LAN protocols."""
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+from Crypto.Util.strxor import strxor
+from Crypto.Random import get_random_bytes
+from msmart.const import MSGTYPE_HANDSHAKE_RESPONSE, MSGTYPE_ENCRYPTED_RESPONSE
+
+_LOGGER = logging.getLogger("emulator")
+
+CODEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, "custom_components", "midea_ac", "codec.py")
+
+
+def load_codec():
+    """Load the codec of the integration without importing Home Assistant."""
+    if (module := sys.modules.get("midea_ac_codec")) is not None:
+        return module
+    spec = importlib.util.spec_from_file_location("midea_ac_codec", CODEC_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+codec = load_codec()
+
+# Frame IDs
+FRAME_SET_STATE = 0x40
+FRAME_GET_STATE = 0x41
+FRAME_STATE = 0xC0
+FRAME_CAPABILITIES = 0xB5
+
+# Capabilities reported by every emulated device
+CAPABILITIES = bytes([
+    # Modes: cool, dry and auto
+    0x14, 0x02, 0x01, 0x00,
+    # Swing modes: vertical and horizontal
+    0x15, 0x02, 0x01, 0x01,
+    # Eco preset
+    0x12, 0x02, 0x01, 0x01,
+    # Turbo preset
+    0x1A, 0x02, 0x01, 0x01,
+])
+
+
+def device_credentials(device_id: int) -> tuple:
+    """Deterministic V3 token and key of an emulated device."""
+    key = hashlib.sha256(b"midea-emulator-key-%d" % device_id).digest()
+    token = hashlib.sha512(b"midea-emulator-token-%d" % device_id).digest()
+    return token, key
+
+
+class EmulatedDevice:
+    """State and protocol handling of a single emulated AC."""
+
+    def __init__(self, device_id: int, port: int, version: int, latency: float, jitter: float, loss: float):
+        self.id = device_id
+        self.port = port
+        self.version = version
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+
+        self.token, self.key = device_credentials(device_id)
+
+        self.power_on = False
+        self.target_temperature = 24.0
+        self.operational_mode = 2
+        self.fan_speed = 102
+        self.swing_mode = 0
+        self.eco_mode = False
+        self.turbo_mode = False
+        self.fahrenheit = False
+        self.indoor_temperature = 22.5
+        self.outdoor_temperature = 30.0
+
+        self.requests = 0
+
+    @property
+    def config(self) -> dict:
+        """Config entry data for the device."""
+        return {
+            "id": str(self.id),
+            "host": "127.0.0.1",
+            "port": self.port,
+            "token": self.token.hex() if self.version == 3 else "",
+            "k1": self.key.hex() if self.version == 3 else "",
+        }
+
+    def state_payload(self) -> bytes:
+        payload = bytearray(24)
+        payload[0] = FRAME_STATE
+        payload[1] = 0x01 if self.power_on else 0
+        integral = int(self.target_temperature) - 16
+        payload[2] = (integral & 0xF) | (0x10 if self.target_temperature % 1 else 0)
+        payload[2] |= (self.operational_mode & 0x7) << 5
+        payload[3] = self.fan_speed
+        payload[7] = self.swing_mode & 0xF
+        payload[8] = 0x20 if self.turbo_mode else 0
+        payload[9] = 0x10 if self.eco_mode else 0
+        payload[10] = (0x02 if self.turbo_mode else 0) | (0x04 if self.fahrenheit else 0)
+        payload[11] = int(self.indoor_temperature * 2 + 50)
+        payload[12] = int(self.outdoor_temperature * 2 + 50)
+        return bytes(payload)
+
+    def apply(self, payload: bytes) -> None:
+        self.power_on = bool(payload[1] & 0x01)
+        self.target_temperature = (payload[2] & 0xF) + 16.0
+        self.target_temperature += 0.5 if payload[2] & 0x10 else 0.0
+        self.operational_mode = (payload[2] >> 5) & 0x7
+        self.fan_speed = payload[3]
+        self.swing_mode = payload[7] & 0xF
+        self.eco_mode = bool(payload[9] & 0x80)
+        self.turbo_mode = bool(payload[10] & 0x02)
+        self.fahrenheit = bool(payload[10] & 0x04)
+
+    def handle_frame(self, frame: bytes) -> bytes | None:
+        """Process a request frame and return the response frame."""
+        self.requests += 1
+
+        payload = frame[10:-2]
+        if payload[0] == FRAME_SET_STATE:
+            self.apply(payload)
+            return codec.encode_frame(self.state_payload(), 0x02)
+        elif payload[0] == FRAME_GET_STATE:
+            return codec.encode_frame(self.state_payload())
+        elif payload[0] == FRAME_CAPABILITIES:
+            return codec.encode_frame(bytes([FRAME_CAPABILITIES, len(CAPABILITIES) // 4]) + CAPABILITIES)
+
+        _LOGGER.warning("Device %d got unknown frame %s.", self.id, frame.hex())
+        return None
+
+
+class DeviceConnection:
+    """A client connection to an emulated device."""
+
+    def __init__(self, device: EmulatedDevice, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.device = device
+        self.reader = reader
+        self.writer = writer
+        self.session = codec.V3Session()
+        self.buffer = b""
+
+    def wrap(self, frame: bytes) -> bytes:
+        """Wrap a frame in an encrypted 0x5A5A packet."""
+        return codec.encode_packet(self.device.id, frame)
+
+    def unwrap(self, packet) -> bytes:
+        return codec.decrypt_payload(packet[40:-16])
+
+    def handshake(self, packet) -> bytes:
+        plain = get_random_bytes(32)
+        payload = codec.cbc_encrypt(plain, self.device.key)
+        sign = hashlib.sha256(plain).digest()
+        self.session.key = strxor(plain, self.device.key)
+        return self.session.encode(payload + sign, MSGTYPE_HANDSHAKE_RESPONSE)
+
+    def next_packets(self) -> list:
+        """Extract complete packets from the receive buffer as views of it."""
+        view = memoryview(self.buffer)
+        packets = []
+        offset = 0
+        while len(view) - offset >= 6:
+            if view[offset:offset + 2] == codec.V3_MAGIC:
+                size = (view[offset + 2] << 8 | view[offset + 3]) + 8
+            elif view[offset:offset + 2] == codec.V2_MAGIC:
+                size = view[offset + 4] | view[offset + 5] << 8
+            else:
+                raise ValueError("Unknown packet")
+
+            if len(view) - offset < size:
+                break
+
+            packets.append(view[offset:offset + size])
+            offset += size
+
+        self.buffer = self.buffer[offset:]
+        return packets
+
+    def respond(self, packet) -> bytes | None:
+        if packet[:2] == codec.V2_MAGIC:
+            response = self.device.handle_frame(self.unwrap(packet))
+            return self.wrap(response) if response else None
+
+        # V3 packets, first is always the handshake
+        if self.session.key is None:
+            return self.handshake(packet)
+
+        inner, _ = self.session.decode(packet)
+        response = self.device.handle_frame(self.unwrap(inner[0]))
+        if response is None:
+            return None
+        return self.session.encode(self.wrap(response), MSGTYPE_ENCRYPTED_RESPONSE)
+
+    def notify(self) -> None:
+        """Send the device state unsolicited, like after a change made with the remote."""
+        packet = self.wrap(codec.encode_frame(self.device.state_payload(), 0x04))
+        if self.device.version == 3:
+            # V3 notifications need the session key of the connection
+            if self.session.key is None:
+                return
+            packet = self.session.encode(packet, MSGTYPE_ENCRYPTED_RESPONSE)
+        self.writer.write(packet)
+
+    async def run(self) -> None:
+        device = self.device
+        try:
+            while data := await self.reader.read(1024):
+                self.buffer += data
+                for packet in self.next_packets():
+                    # Simulate network and device latency
+                    await asyncio.sleep(max(0, random.gauss(device.latency, device.jitter)))
+
+                    # Simulate packet loss by never responding
+                    if random.random() < device.loss:
+                        continue
+
+                    if (response := self.respond(packet)) is not None:
+                        self.writer.write(response)
+                        await self.writer.drain()
+        except (ConnectionError, ValueError) as e:
+            _LOGGER.debug("Device %d connection error: %s", device.id, e)
+        finally:
+            self.writer.close()
+
+
+class Emulator:
+    """A fleet of emulated devices, each listening on its own port."""
+
+    def __init__(self, count: int, base_port: int = 16444, v3_fraction: float = 0.5,
+                 latency: float = 0.05, jitter: float = 0.01, loss: float = 0.0,
+                 base_id: int = 0x10000000000):
+        self.devices = []
+        for i in range(count):
+            version = 3 if i < round(count * v3_fraction) else 2
+            self.devices.append(EmulatedDevice(
+                base_id + i, base_port + i, version, latency, jitter, loss))
+        self._servers = []
+        self._connections = {}
+
+    async def start(self) -> None:
+        for device in self.devices:
+            async def handle(reader, writer, device=device):
+                connection = DeviceConnection(device, reader, writer)
+                self._connections[connection] = asyncio.current_task()
+                try:
+                    await connection.run()
+                finally:
+                    self._connections.pop(connection)
+
+            self._servers.append(await asyncio.start_server(handle, "127.0.0.1", device.port))
+
+    async def stop(self) -> None:
+        for server in self._servers:
+            server.close()
+        # Let open connections finish so their handlers don't end cancelled
+        for connection in self._connections:
+            connection.writer.close()
+        await asyncio.gather(*self._connections.values())
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers.clear()
+
+    @property
+    def configs(self) -> list:
+        return [device.config for device in self.devices]
+
+    def notify(self, device: EmulatedDevice) -> None:
+        """Push the state of a device to all of its connections."""
+        for connection in self._connections:
+            if connection.device is device:
+                connection.notify()
+
+    async def remote_changes(self, interval: float) -> None:
+        """Change the target temperature of a random device now and then, as with a remote."""
+        while True:
+            await asyncio.sleep(interval)
+            device = random.choice(self.devices)
+            device.target_temperature = float(random.randint(17, 30))
+            self.notify(device)
+
+
+async def main(args) -> None:
+    emulator = Emulator(args.count, args.base_port, args.v3_fraction,
+                        args.latency, args.jitter, args.loss)
+    await emulator.start()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(emulator.configs, f, indent=2)
+
+    print("Emulating {} devices on ports {}-{}".format(
+        args.count, args.base_port, args.base_port + args.count - 1))
+
+    if args.remote_interval:
+        await emulator.remote_changes(args.remote_interval)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Emulate a fleet of Midea AC devices on localhost")
+    parser.add_argument("-n", "--count", type=int, default=10,
+                        help="number of devices")
+    parser.add_argument("--base-port", type=int, default=16444,
+                        help="port of the first device")
+    parser.add_argument("--v3-fraction", type=float, default=0.5,
+                        help="fraction of devices using the V3 protocol")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01,
+                        help="standard deviation of response latency in seconds")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability a request is never answered")
+    parser.add_argument("--remote-interval", type=float, default=0,
+                        help="seconds between state changes pushed as if made with a remote")
+    parser.add_argument("-o", "--output", type=str,
+                        help="write device configs to this JSON file")
+    parser.add_argument("-d", "--debug", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -2,51 +2,109 @@
 from __future__ import annotations
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_HOST, CONF_ID, CONF_PORT, CONF_TOKEN
+from homeassistant.const import CONF_DEVICES, CONF_HOST, CONF_ID, CONF_PORT, CONF_TOKEN, Platform
 from homeassistant.core import HomeAssistant
-from msmart.device import air_conditioning as ac
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.typing import ConfigType
+import voluptuous as vol
 
 # Local constants
 from .const import (
     DOMAIN,
-    CONF_K1
+    CONF_K1,
+    CONF_PROMPT_TONE,
+    CONF_KEEP_LAST_KNOWN_ONLINE_STATE,
+    CONF_MAX_CONCURRENT_REQUESTS,
+    CONF_DEVICES_FILE,
+    DEFAULT_MAX_CONCURRENT_REQUESTS
 )
+from .coordinator import MideaDeviceUpdateCoordinator
+from .device import MideaDevice
+from .fleet import MideaFleet
+from .importer import DEVICE_SCHEMA, async_import_devices
+from .services import async_setup_services
+
+PLATFORMS = [Platform.CLIMATE, Platform.SENSOR]
+
+CONFIG_SCHEMA = vol.Schema({
+    DOMAIN: vol.Schema({
+        vol.Optional(CONF_MAX_CONCURRENT_REQUESTS,
+                     default=DEFAULT_MAX_CONCURRENT_REQUESTS): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_DEVICES, default=[]): vol.All(cv.ensure_list, [DEVICE_SCHEMA]),
+        vol.Optional(CONF_DEVICES_FILE): cv.string,
+    })
+}, extra=vol.ALLOW_EXTRA)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the fleet shared by all Midea AC devices."""
+
+    # Get global config from configuration.yaml
+    domain_config = config.get(DOMAIN, {})
+    max_in_flight = domain_config.get(
+        CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS)
+
+    hass.data[DOMAIN] = fleet = MideaFleet(hass, max_in_flight)
+
+    async_setup_services(hass, fleet)
+
+    # Import devices listed in configuration.yaml or a CSV file in the background
+    devices = domain_config.get(CONF_DEVICES, [])
+    devices_file = domain_config.get(CONF_DEVICES_FILE)
+    if devices or devices_file:
+        hass.async_create_task(async_import_devices(
+            hass, devices, hass.config.path(devices_file) if devices_file else None))
+
+    return True
 
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> bool:
     """Set up a Midea AC device from a config entry."""
 
-    # Ensure the global data dict exists
-    hass.data.setdefault(DOMAIN, {})
+    # Fetch the fleet from global data
+    fleet = hass.data[DOMAIN]
 
-    # Get config data from entry
+    # Get config and options data from entry
     config = config_entry.data
+    options = config_entry.options
 
-    # Attempt to get device from global data
+    # Attempt to get coordinator from global data
     id = config.get(CONF_ID)
-    device = hass.data[DOMAIN].get(id)
+    coordinator = fleet.coordinators.get(id)
 
-    # Construct a new device if necessary
-    if device is None:
+    # Construct a new device and coordinator if necessary
+    if coordinator is None:
         # Construct the device
-        id = config.get(CONF_ID)
         host = config.get(CONF_HOST)
         port = config.get(CONF_PORT)
-        device = ac(host, int(id), port)
+        device = MideaDevice(host, int(id), port, fleet.limiter, fleet.tracer)
 
-        # Configure token and k1 as needed
+        # Configure token and k1 as needed, authentication occurs on first request
         token = config.get(CONF_TOKEN)
         k1 = config.get(CONF_K1)
         if token and k1:
-            await hass.async_add_executor_job(device.authenticate, k1, token)
+            device.set_credentials(k1, token)
+
+        # Apply options
+        device.prompt_tone = options.get(CONF_PROMPT_TONE)
+        device.keep_last_known_online_state = options.get(
+            CONF_KEEP_LAST_KNOWN_ONLINE_STATE)
+
+        # Create a coordinator to refresh the device for all entities
+        coordinator = MideaDeviceUpdateCoordinator(hass, device, options)
 
-        hass.data[DOMAIN][id] = device
+        fleet.coordinators[id] = coordinator
 
-    # Create platform entries
-    hass.async_create_task(
-        hass.config_entries.async_forward_entry_setup(config_entry, "climate"))
-    hass.async_create_task(
-        hass.config_entries.async_forward_entry_setup(config_entry, "sensor"))
+    # Create platform entries, which are unavailable until the device answers
+    await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
+
+    # Authenticate and populate data in the background so startup doesn't wait on devices
+    config_entry.async_create_background_task(
+        hass, coordinator.async_refresh(), f"{DOMAIN} {id} refresh")
+
+    # Receive state changes the device pushes, like those made with the remote
+    config_entry.async_create_background_task(
+        hass, coordinator.async_listen(), f"{DOMAIN} {id} listener")
 
     # Reload entry when its updated
     config_entry.async_on_unload(
@@ -60,12 +118,13 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
     # Get config data from entry
     config = config_entry.data
 
-    # Remove device from global data
-    id = config.get(CONF_ID)
-    hass.data[DOMAIN].pop(id)
+    if not await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS):
+        return False
 
-    await hass.config_entries.async_forward_entry_unload(config_entry, "climate")
-    await hass.config_entries.async_forward_entry_unload(config_entry, "sensor")
+    # Remove device from global data and close its connection
+    id = config.get(CONF_ID)
+    coordinator = hass.data[DOMAIN].coordinators.pop(id)
+    await coordinator.device.async_close()
 
     return True
 
@@ -0,0 +1,89 @@
+"""Circuit breaker backing off from unreachable Midea Smart AC devices."""
+from __future__ import annotations
+
+import datetime
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Consecutive failed requests after which the circuit opens
+FAILURE_THRESHOLD = 3
+
+# Delay before the first probe of an open circuit, doubled after each failed probe
+BACKOFF_BASE = datetime.timedelta(minutes=1)
+
+# Longest delay between probes of an open circuit
+BACKOFF_MAX = datetime.timedelta(minutes=30)
+
+# Seconds a probe may come early, scheduled polls are rounded to whole seconds
+PROBE_SLACK = 1
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class MideaCircuitBreaker:
+    """Stop sending requests to a device that keeps failing.
+
+    After enough consecutive failures the circuit opens and requests are
+    refused until a backoff delay passes. The next request is then let
+    through as a probe. A successful probe closes the circuit, a failed
+    one opens it again with twice the delay, up to a maximum.
+    """
+
+    def __init__(self, device_id: int) -> None:
+        self._device_id = device_id
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._backoff = BACKOFF_BASE
+        self._retry_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != STATE_CLOSED
+
+    @property
+    def backoff(self) -> datetime.timedelta:
+        """Delay until the next probe while the circuit is open."""
+        return self._backoff
+
+    def allow_request(self) -> bool:
+        """Check if a request may be sent, turning a due open circuit half open."""
+        if self.state == STATE_OPEN and time.monotonic() >= self._retry_at - PROBE_SLACK:
+            self.state = STATE_HALF_OPEN
+        return self.state != STATE_OPEN
+
+    def record(self, success: bool) -> None:
+        """Record the outcome of a request."""
+        if success:
+            if self.is_open:
+                _LOGGER.info("Device %s is reachable again.", self._device_id)
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self._backoff = BACKOFF_BASE
+            return
+
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN:
+            self._backoff = min(self._backoff * 2, BACKOFF_MAX)
+        elif self.state == STATE_CLOSED and self.failures >= FAILURE_THRESHOLD:
+            self.trips += 1
+            _LOGGER.warning("Device %s failed %d consecutive requests, backing off.",
+                            self._device_id, self.failures)
+        else:
+            return
+
+        self.state = STATE_OPEN
+        self._retry_at = time.monotonic() + self._backoff.total_seconds()
+        _LOGGER.debug("Probing device %s again in %s.", self._device_id, self._backoff)
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "backoff": self._backoff.total_seconds(),
+        }
@@ -0,0 +1,84 @@
+"""Persistent device capability cache for Midea Smart AC."""
+from __future__ import annotations
+
+import datetime
+import logging
+import time
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+# Local constants
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.capabilities"
+
+# Delay before writing changes so a fleet of updates is saved at once
+SAVE_DELAY = 10
+
+# Age after which cached capabilities are revalidated
+CAPABILITY_TTL = datetime.timedelta(days=1)
+
+# Delay before querying again after a failed query, doubled after each failure
+CAPABILITY_RETRY_BASE = datetime.timedelta(minutes=1)
+
+# Longest delay between failed queries
+CAPABILITY_RETRY_MAX = datetime.timedelta(hours=1)
+
+DATA_CAPABILITY_CACHE = f"{DOMAIN}_capability_cache"
+
+
+class MideaCapabilityCache:
+    """Capabilities of each device stored by appliance ID."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._data = {}
+        self._load_task = None
+
+    async def async_load(self) -> None:
+        """Load the cache from storage, sharing the load between concurrent callers."""
+        if self._load_task is None:
+            self._load_task = self._hass.async_create_task(self._async_load())
+        await self._load_task
+
+    async def _async_load(self) -> None:
+        self._data = await self._store.async_load() or {}
+
+    def get(self, id: str) -> dict | None:
+        """Return the cached capabilities of a device."""
+        if (entry := self._data.get(str(id))) is None:
+            return None
+        return entry["capabilities"]
+
+    def is_stale(self, id: str) -> bool:
+        """Check if the cached capabilities of a device should be revalidated."""
+        return self.expires_in(id) <= 0
+
+    def expires_in(self, id: str) -> float:
+        """Seconds until the cached capabilities of a device become stale."""
+        if (entry := self._data.get(str(id))) is None:
+            return 0
+        return entry["timestamp"] + CAPABILITY_TTL.total_seconds() - time.time()
+
+    def async_set(self, id: str, capabilities: dict) -> None:
+        """Cache the capabilities of a device."""
+        self._data[str(id)] = {
+            "capabilities": capabilities,
+            "timestamp": time.time(),
+        }
+        self._store.async_delay_save(lambda: self._data, SAVE_DELAY)
+
+
+async def async_get_capability_cache(hass: HomeAssistant) -> MideaCapabilityCache:
+    """Return the shared capability cache, loading it if necessary."""
+    if (cache := hass.data.get(DATA_CAPABILITY_CACHE)) is None:
+        cache = MideaCapabilityCache(hass)
+        hass.data[DATA_CAPABILITY_CACHE] = cache
+
+    await cache.async_load()
+    return cache
@@ -8,7 +8,7 @@ This is still early work in progress
 """
 from __future__ import annotations
 
-import datetime
+import asyncio
 import logging
 
 from homeassistant.config_entries import ConfigEntry
@@ -20,25 +20,34 @@ except ImportError:
 from homeassistant.components.climate.const import (
     SUPPORT_TARGET_TEMPERATURE, SUPPORT_FAN_MODE, SUPPORT_SWING_MODE,
     SUPPORT_PRESET_MODE, PRESET_NONE, PRESET_ECO, PRESET_BOOST)
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from msmart.device import air_conditioning as ac
 
 # Local constants
+from .capabilities import (
+    CAPABILITY_RETRY_BASE,
+    CAPABILITY_RETRY_MAX,
+    MideaCapabilityCache,
+    async_get_capability_cache
+)
 from .const import (
     DOMAIN,
-    CONF_PROMPT_TONE,
     CONF_TEMP_STEP,
-    CONF_INCLUDE_OFF_AS_STATE,
     CONF_USE_FAN_ONLY_WORKAROUND,
-    CONF_KEEP_LAST_KNOWN_ONLINE_STATE
+    CONF_OPTIMISTIC_STATE,
+    CONF_DEADBAND,
+    CONF_MIN_WRITE_INTERVAL,
+    DEFAULT_DEADBAND,
+    DEFAULT_MIN_WRITE_INTERVAL
 )
+from .coordinator import MideaDeviceUpdateCoordinator
+from .deadband import MideaDeadbandFilter
+from .device import MideaDevice
 
 _LOGGER = logging.getLogger(__name__)
 
-# Override default scan interval?
-SCAN_INTERVAL = datetime.timedelta(seconds=15)
-
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -53,73 +62,178 @@ async def async_setup_entry(
     config = config_entry.data
     options = config_entry.options
 
-    # Fetch device from global data
+    # Fetch coordinator from global data
     id = config.get(CONF_ID)
-    device = hass.data[DOMAIN][id]
+    coordinator = hass.data[DOMAIN].coordinators[id]
 
-    # Query device capabilities
-    _LOGGER.info("Querying device capabilities.")
-    await hass.async_add_executor_job(device.get_capabilities)
+    # Load device capabilities from the cache
+    device = coordinator.device
+    cache = await async_get_capability_cache(hass)
+    if (capabilities := cache.get(device.id)) is not None:
+        device.restore_capabilities(capabilities)
+
+    # Query missing or outdated capabilities in the background, entities update once they arrive
+    config_entry.async_create_background_task(
+        hass, _async_keep_capabilities(coordinator, cache), f"{DOMAIN} {device.id} capabilities")
 
     add_entities([
-        MideaClimateACDevice(hass, device, options)
+        MideaClimateACDevice(hass, coordinator, options)
     ])
 
 
-class MideaClimateACDevice(ClimateEntity):
+def set_device_state(device: MideaDevice, include_off_as_state: bool = True, hvac_mode: str | None = None,
+                     temperature: float | None = None, fan_mode: str | None = None,
+                     swing_mode: str | None = None, preset_mode: str | None = None) -> None:
+    """Change the local state of a device from climate entity values, without applying it."""
+    if hvac_mode is not None:
+        if include_off_as_state and hvac_mode == "off":
+            device.power_state = False
+        else:
+            if include_off_as_state:
+                device.power_state = True
+            device.operational_mode = ac.operational_mode_enum[hvac_mode]
+
+    if temperature is not None:
+        # round temperature to nearest .5
+        device.target_temperature = round(temperature * 2) / 2
+
+    if fan_mode is not None:
+        # Fix key error when calling from HomeKit
+        device.fan_speed = ac.fan_speed_enum[fan_mode.capitalize()]
+
+    if swing_mode is not None:
+        device.swing_mode = ac.swing_mode_enum[swing_mode]
+
+    if preset_mode == PRESET_NONE:
+        device.eco_mode = False
+        device.turbo_mode = False
+    elif preset_mode == PRESET_BOOST:
+        device.eco_mode = False
+        device.turbo_mode = True
+    elif preset_mode == PRESET_ECO:
+        device.turbo_mode = False
+        device.eco_mode = True
+
+
+async def _async_query_capabilities(coordinator: MideaDeviceUpdateCoordinator, cache: MideaCapabilityCache) -> bool:
+    """Query device capabilities and store them in the cache."""
+    device = coordinator.device
+
+    _LOGGER.info("Querying device capabilities.")
+    if not await device.async_get_capabilities():
+        _LOGGER.warning(
+            "Failed to query capabilities of device %s.", device.id)
+        return False
+
+    cache.async_set(device.id, device.capabilities)
+
+    # Update entities with the new capabilities
+    coordinator.async_update_listeners()
+    return True
+
+
+async def _async_keep_capabilities(coordinator: MideaDeviceUpdateCoordinator, cache: MideaCapabilityCache) -> None:
+    """Query capabilities whenever the cache is stale, retrying failed queries with a growing delay."""
+    device = coordinator.device
+    available = asyncio.Event()
+
+    @callback
+    def _async_check_available() -> None:
+        if coordinator.last_update_success:
+            available.set()
+
+    remove_listener = coordinator.async_add_listener(_async_check_available)
+    try:
+        retry = CAPABILITY_RETRY_BASE
+        while True:
+            if (expires_in := cache.expires_in(device.id)) > 0:
+                await asyncio.sleep(expires_in)
+                continue
+
+            # Wait for a successful refresh rather than fail while the device is offline
+            if not coordinator.last_update_success:
+                available.clear()
+                await available.wait()
+
+            if await _async_query_capabilities(coordinator, cache):
+                retry = CAPABILITY_RETRY_BASE
+            else:
+                await asyncio.sleep(retry.total_seconds())
+                retry = min(retry * 2, CAPABILITY_RETRY_MAX)
+    finally:
+        remove_listener()
+
+
+class MideaClimateACDevice(CoordinatorEntity, ClimateEntity):
     """Representation of a Midea climate AC device."""
 
-    def __init__(self, hass, device, options: dict):
+    def __init__(self, hass, coordinator: MideaDeviceUpdateCoordinator, options: dict):
         """Initialize the climate device."""
+        super().__init__(coordinator)
 
         self.hass = hass
+        device = coordinator.device
         self._device = device
 
-        # Apply options
-        self._device.prompt_tone = options.get(CONF_PROMPT_TONE)
-        self._device.keep_last_known_online_state = options.get(
-            CONF_KEEP_LAST_KNOWN_ONLINE_STATE)
-
         # Display on the AC should use the same unit as homeassistant
         self._device.fahrenheit = (
             hass.config.units.temperature_unit == TEMP_FAHRENHEIT)
 
         self._target_temperature_step = options.get(CONF_TEMP_STEP)
-        self._include_off_as_state = options.get(CONF_INCLUDE_OFF_AS_STATE)
+        self._include_off_as_state = coordinator.include_off_as_state
         self._use_fan_only_workaround = options.get(
             CONF_USE_FAN_ONLY_WORKAROUND)
 
-        self._operation_list = device.supported_operation_modes
-        if self._include_off_as_state:
-            self._operation_list.append("off")
-
         self._fan_list = ac.fan_speed_enum.list()
-        self._swing_list = device.supported_swing_modes
 
-        self._changed = False
+        # Write requested state immediately and confirm it in the background
+        self._optimistic = options.get(CONF_OPTIMISTIC_STATE, False)
+        self._confirmed_state = device.state
+
+        # Skip polled states whose only change is jitter of the current temperature
+        self._filter = MideaDeadbandFilter(
+            options.get(CONF_DEADBAND, DEFAULT_DEADBAND),
+            options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL))
 
     async def apply_changes(self) -> None:
-        if not self._changed:
+        if self._optimistic:
+            self.async_write_ha_state()
+            self.hass.async_create_task(self._async_confirm_changes())
             return
-        await self.hass.async_add_executor_job(self._device.apply)
-        await self.async_update_ha_state()
-        self._changed = False
-
-    async def async_update(self) -> None:
-        """Retrieve latest state from the appliance if no changes made,
-        otherwise update the remote device state."""
-        if self._changed:
-            await self.hass.async_add_executor_job(self._device.apply)
-            self._changed = False
-        elif not self._use_fan_only_workaround:
-            await self.hass.async_add_executor_job(self._device.refresh)
-
-    async def async_added_to_hass(self) -> None:
-        """Run when entity about to be added."""
-        await super().async_added_to_hass()
-
-        # Populate data ASAP
-        await self.async_update()
+
+        await self._async_confirm_changes()
+
+    async def _async_confirm_changes(self) -> None:
+        """Apply changes and reconcile with the device, reverting if it never confirms them."""
+        if await self.coordinator.async_apply():
+            # The coordinator already wrote the confirmed state of every entity
+            self._confirmed_state = self._device.state
+            return
+
+        # Take back the state that was shown before it was confirmed
+        if self._optimistic:
+            _LOGGER.warning("Device %s did not confirm changes, reverting.",
+                            self._device.id)
+            self._device.restore_state(self._confirmed_state)
+            self.async_write_ha_state()
+
+    def _filtered_state(self) -> tuple:
+        """Parts of the state that are written whenever they change."""
+        return (self.available, self._device.state, tuple(self.hvac_modes), tuple(self.swing_modes))
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        # Changes requested by the user are always written
+        self._filter.record(self.current_temperature, self._filtered_state())
+        super().async_write_ha_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        # Only state read from the device is confirmed, not changes that failed to apply
+        if self.coordinator.last_update_success and not self.coordinator.apply_pending:
+            self._confirmed_state = self._device.state
+        if self._filter.should_write(self.current_temperature, self._filtered_state()):
+            super()._handle_coordinator_update()
 
     @property
     def device_info(self) -> dict:
@@ -134,7 +248,7 @@ class MideaClimateACDevice(ClimateEntity):
     @property
     def available(self) -> bool:
         """Checks if the appliance is available for commands."""
-        return self._device.online
+        return self.coordinator.last_update_success and self._device.online
 
     @property
     def supported_features(self) -> int:
@@ -149,7 +263,10 @@ class MideaClimateACDevice(ClimateEntity):
     @property
     def hvac_modes(self) -> list:
         """Return the list of available operation modes."""
-        return self._operation_list
+        operation_list = list(self._device.supported_operation_modes)
+        if self._include_off_as_state:
+            operation_list.append("off")
+        return operation_list
 
     @property
     def fan_modes(self) -> list:
@@ -159,18 +276,13 @@ class MideaClimateACDevice(ClimateEntity):
     @property
     def swing_modes(self) -> list:
         """List of available swing modes."""
-        return self._swing_list
+        return self._device.supported_swing_modes
 
     @property
     def assumed_state(self) -> bool:
         """Assume state rather than refresh to workaround fan_only bug."""
         return self._use_fan_only_workaround
 
-    @property
-    def should_poll(self) -> bool:
-        """Poll the appliance for changes, there is no notification capability in the Midea API"""
-        return not self._use_fan_only_workaround
-
     @property
     def unique_id(self) -> str:
         return f"{self._device.id}"
@@ -220,54 +332,27 @@ class MideaClimateACDevice(ClimateEntity):
     async def async_set_temperature(self, **kwargs) -> None:
         """Set new target temperatures."""
         if kwargs.get(ATTR_TEMPERATURE) is not None:
-            # grab temperature from front end UI
-            temp = kwargs.get(ATTR_TEMPERATURE)
-
-            # round temperature to nearest .5
-            temp = round(temp * 2) / 2
-
-            # send temperature to unit
-            self._device.target_temperature = temp
-            self._changed = True
+            # grab temperature from front end UI and send it to unit
+            set_device_state(self._device, temperature=kwargs.get(ATTR_TEMPERATURE))
             await self.apply_changes()
 
     async def async_set_swing_mode(self, swing_mode) -> None:
         """Set swing mode."""
-        self._device.swing_mode = ac.swing_mode_enum[swing_mode]
-        self._changed = True
+        set_device_state(self._device, swing_mode=swing_mode)
         await self.apply_changes()
 
     async def async_set_fan_mode(self, fan_mode) -> None:
         """Set fan mode."""
-        """Fix key error when calling from HomeKit"""
-        fan_mode = fan_mode.capitalize()
-        self._device.fan_speed = ac.fan_speed_enum[fan_mode]
-        self._changed = True
+        set_device_state(self._device, fan_mode=fan_mode)
         await self.apply_changes()
 
     async def async_set_hvac_mode(self, hvac_mode) -> None:
         """Set hvac mode."""
-        if self._include_off_as_state and hvac_mode == "off":
-            self._device.power_state = False
-        else:
-            if self._include_off_as_state:
-                self._device.power_state = True
-            self._device.operational_mode = ac.operational_mode_enum[hvac_mode]
-        self._changed = True
+        set_device_state(self._device, self._include_off_as_state, hvac_mode=hvac_mode)
         await self.apply_changes()
 
     async def async_set_preset_mode(self, preset_mode: str) -> None:
-        if preset_mode == PRESET_NONE:
-            self._device.eco_mode = False
-            self._device.turbo_mode = False
-        elif preset_mode == PRESET_BOOST:
-            self._device.eco_mode = False
-            self._device.turbo_mode = True
-        elif preset_mode == PRESET_ECO:
-            self._device.turbo_mode = False
-            self._device.eco_mode = True
-
-        self._changed = True
+        set_device_state(self._device, preset_mode=preset_mode)
         await self.apply_changes()
 
     @property
@@ -286,13 +371,11 @@ class MideaClimateACDevice(ClimateEntity):
     async def async_turn_on(self) -> None:
         """Turn on."""
         self._device.power_state = True
-        self._changed = True
         await self.apply_changes()
 
     async def async_turn_off(self) -> None:
         """Turn off."""
         self._device.power_state = False
-        self._changed = True
         await self.apply_changes()
 
     @property
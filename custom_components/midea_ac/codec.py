@@ -0,0 +1,396 @@
+"""Codec of the Midea LAN protocol.
+
+Encodes and decodes the 0x5A5A packets of V2 devices and the 0x8370
+messages of V3 sessions. Buffers are sliced through memoryviews instead
+of being copied at each step, AES ciphers are created once per key, and
+the payloads of all packets or V3 messages in a read are decrypted with a
+single cipher call.
+
+This module must not import Home Assistant or the rest of the integration,
+the benchmark emulator and pcap-decrypt.py load it directly from its path.
+"""
+from __future__ import annotations
+
+import datetime
+from functools import lru_cache
+from hashlib import md5, sha256
+import os
+
+from Crypto.Cipher import AES
+from Crypto.Util.strxor import strxor
+from msmart.const import MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_ENCRYPTED_RESPONSE
+import msmart.crc8 as crc8
+
+BLOCK_SIZE = 16
+
+# Key signing 0x5A5A packets, its hash encrypts their payload
+SIGN_KEY = b"xhdiwjnchekd4d512chdjx5d8e4c394D2D7S"
+ENC_KEY = md5(SIGN_KEY).digest()
+
+V2_MAGIC = b"\x5a\x5a"
+V3_MAGIC = b"\x83\x70"
+
+# Start of an unencrypted frame, and the length of its header
+FRAME_START = 0xAA
+FRAME_HEADER_LENGTH = 10
+
+# Appliance type of air conditioners
+APPLIANCE_TYPE_AC = 0xAC
+
+# Lengths of the 0x5A5A packet header and trailing signature
+PACKET_HEADER_LENGTH = 40
+PACKET_SIGN_LENGTH = 16
+
+# Lengths of the 0x8370 header, message counter and signature of encrypted messages
+V3_HEADER_LENGTH = 6
+V3_COUNTER_LENGTH = 2
+V3_SIGN_LENGTH = 32
+
+# Message counters wrap before reaching this value
+V3_MAX_COUNT = 0xFFF
+
+# Frame IDs of a set command and a state response
+FRAME_SET_STATE = 0x40
+FRAME_STATE = 0xC0
+
+_ZERO_BLOCK = bytes(BLOCK_SIZE)
+
+
+@lru_cache(maxsize=1024)
+def _ecb_cipher(key: bytes):
+    return AES.new(key, AES.MODE_ECB)
+
+
+def ecb_cipher(key: bytes = ENC_KEY):
+    """Return a shared ECB cipher for a key, ECB ciphers keep no state between calls."""
+    return _ecb_cipher(bytes(key))
+
+
+def cbc_encrypt(data, key: bytes) -> bytes:
+    """Encrypt whole blocks in CBC mode with a zero IV.
+
+    CBC ciphers carry the chain over to the next call, so each message
+    needs its own. Chaining blocks through the shared ECB cipher is slower.
+    """
+    return AES.new(key, AES.MODE_CBC, iv=_ZERO_BLOCK).encrypt(data)
+
+
+def cbc_decrypt_messages(messages: list, key: bytes) -> bytes:
+    """Decrypt many messages of whole blocks in CBC mode with a zero IV.
+
+    Unlike encryption, every block can be decrypted at once and then
+    combined with the preceding ciphertext block of its message, so all
+    messages share a single cipher call. Returns the joined plaintexts.
+    """
+    ciphertext = b"".join(messages)
+    previous = bytearray(len(ciphertext))
+    offset = 0
+    for message in messages:
+        previous[offset + BLOCK_SIZE:offset + len(message)] = message[:-BLOCK_SIZE]
+        offset += len(message)
+    return strxor(ecb_cipher(key).decrypt(ciphertext), previous)
+
+
+def cbc_decrypt(data, key: bytes) -> bytes:
+    """Decrypt whole blocks in CBC mode with a zero IV."""
+    if not data:
+        return b""
+    return cbc_decrypt_messages([memoryview(data)], key)
+
+
+def _pad(data) -> bytes:
+    """PKCS#7 pad data to whole blocks."""
+    padding = BLOCK_SIZE - len(data) % BLOCK_SIZE
+    return bytes(data) + bytes((padding,)) * padding
+
+
+def _unpad(data: memoryview) -> memoryview | None:
+    if not data:
+        return None
+    padding = data[-1]
+    if not 0 < padding <= BLOCK_SIZE or data[-padding:] != bytes((padding,)) * padding:
+        return None
+    return data[:-padding]
+
+
+def decrypt_payloads(payloads: list) -> list[bytes]:
+    """Decrypt the payloads of many 0x5A5A packets with a single cipher call.
+
+    ECB blocks decrypt independently, so the payloads are joined and split
+    again afterwards. Payloads that are malformed decrypt to empty bytes.
+    """
+    valid = [len(p) and len(p) % BLOCK_SIZE == 0 for p in payloads]
+    plain = memoryview(ecb_cipher().decrypt(b"".join(p for p, ok in zip(payloads, valid) if ok)))
+
+    results = []
+    offset = 0
+    for payload, ok in zip(payloads, valid):
+        if not ok:
+            results.append(b"")
+            continue
+        frame = _unpad(plain[offset:offset + len(payload)])
+        offset += len(payload)
+        results.append(bytes(frame) if frame is not None else b"")
+    return results
+
+
+def decrypt_payload(payload) -> bytes:
+    """Decrypt the payload of a single 0x5A5A packet."""
+    return decrypt_payloads([payload])[0]
+
+
+def _packet_time(now: datetime.datetime) -> bytes:
+    # Digit pairs of the time down to centiseconds, least significant first
+    return bytes((now.microsecond // 10000, now.second, now.minute, now.hour,
+                  now.day, now.month, now.year % 100, now.year // 100))
+
+
+def encode_packet(device_id: int, frame, now: datetime.datetime | None = None) -> bytes:
+    """Wrap a frame in a signed 0x5A5A packet with an encrypted payload."""
+    payload = ecb_cipher().encrypt(_pad(frame))
+    size = PACKET_HEADER_LENGTH + len(payload) + PACKET_SIGN_LENGTH
+
+    packet = bytearray(size)
+    packet[0:4] = b"\x5a\x5a\x01\x11"
+    packet[4:6] = size.to_bytes(2, "little")
+    packet[6:8] = b"\x20\x00"
+    packet[12:20] = _packet_time(now or datetime.datetime.now())
+    packet[20:28] = device_id.to_bytes(8, "little")
+    packet[PACKET_HEADER_LENGTH:-PACKET_SIGN_LENGTH] = payload
+
+    sign = md5(memoryview(packet)[:-PACKET_SIGN_LENGTH])
+    sign.update(SIGN_KEY)
+    packet[-PACKET_SIGN_LENGTH:] = sign.digest()
+    return bytes(packet)
+
+
+def split_packets(data) -> tuple[list[memoryview], int]:
+    """Split complete 0x5A5A packets and unencrypted frames off the start of a buffer.
+
+    Returns views of the packets and the number of bytes they took up.
+    Raises ValueError at data that starts neither.
+    """
+    view = memoryview(data)
+    packets = []
+    offset = 0
+    while len(view) - offset >= 6:
+        if view[offset:offset + 2] == V2_MAGIC:
+            size = view[offset + 4] | view[offset + 5] << 8
+        elif view[offset] == FRAME_START:
+            size = view[offset + 1] + 1
+        else:
+            raise ValueError(f"Unknown packet {bytes(view[offset:offset + 8]).hex()}")
+
+        if size < 6:
+            raise ValueError(f"Invalid packet size {size}")
+        if len(view) - offset < size:
+            break
+
+        packets.append(view[offset:offset + size])
+        offset += size
+    return packets, offset
+
+
+def decrypt_packets(packets: list) -> list[bytes]:
+    """Return the frames held by 0x5A5A packets or passed unencrypted, in one batch.
+
+    Packets too short to hold a frame give empty bytes.
+    """
+    frames = [None] * len(packets)
+    payloads = []
+    encrypted = []
+    for i, packet in enumerate(packets):
+        if len(packet) > PACKET_HEADER_LENGTH + PACKET_SIGN_LENGTH and packet[0] != FRAME_START:
+            payloads.append(memoryview(packet)[PACKET_HEADER_LENGTH:-PACKET_SIGN_LENGTH])
+            encrypted.append(i)
+        else:
+            frames[i] = bytes(packet)
+
+    for i, frame in zip(encrypted, decrypt_payloads(payloads)):
+        frames[i] = frame
+    return frames
+
+
+def checksum(frame) -> int:
+    """Checksum of a frame, without its start byte and its checksum."""
+    return -sum(memoryview(frame)[1:-1]) & 0xFF
+
+
+def encode_frame(payload, frame_type: int = 0x03) -> bytes:
+    """Build a frame around a payload, with its CRC and checksum."""
+    size = FRAME_HEADER_LENGTH + len(payload) + 2
+    frame = bytearray(size)
+    frame[0:4] = bytes((FRAME_START, size - 1, APPLIANCE_TYPE_AC, APPLIANCE_TYPE_AC ^ (size - 1)))
+    frame[9] = frame_type
+    frame[FRAME_HEADER_LENGTH:-2] = payload
+    frame[-2] = crc8.calculate(payload)
+    frame[-1] = checksum(frame)
+    return bytes(frame)
+
+
+def decode_state(frame) -> dict | None:
+    """Decode the state held by a state response or set command frame.
+
+    Returns None for other or corrupt frames. Set commands carry no
+    temperatures, so those are None.
+    """
+    frame = memoryview(frame)
+    if len(frame) < FRAME_HEADER_LENGTH + 15 or frame[0] != FRAME_START:
+        return None
+    id = frame[FRAME_HEADER_LENGTH]
+    if id not in (FRAME_STATE, FRAME_SET_STATE) or checksum(frame) != frame[-1]:
+        return None
+
+    payload = frame[FRAME_HEADER_LENGTH:-2]
+    response = id == FRAME_STATE
+    return {
+        "power_state": bool(payload[1] & 0x01),
+        "operational_mode": (payload[2] >> 5) & 0x7,
+        "target_temperature": (payload[2] & 0xF) + 16.0 + (0.5 if payload[2] & 0x10 else 0.0),
+        "fan_speed": payload[3],
+        "swing_mode": payload[7] & 0xF,
+        "eco_mode": bool(payload[9] & (0x10 if response else 0x80)),
+        "turbo_mode": bool(payload[8] & 0x20 or payload[10] & 0x02),
+        "fahrenheit": bool(payload[10] & 0x04),
+        "indoor_temperature": (payload[11] - 50) / 2.0 if response else None,
+        "outdoor_temperature": (payload[12] - 50) / 2.0 if response else None,
+    }
+
+
+def decode_states(packets: list) -> list[dict | None]:
+    """Decrypt and decode the state of many 0x5A5A packets in one batch."""
+    return [decode_state(frame) for frame in decrypt_packets(packets)]
+
+
+class V3Session:
+    """Session key and message counter of a V3 connection."""
+
+    def __init__(self, key: bytes | None = None) -> None:
+        self.key = key
+        self.request_count = 0
+        self.response_count = 0
+
+    @property
+    def key(self) -> bytes | None:
+        return self._key
+
+    @key.setter
+    def key(self, key: bytes | None) -> None:
+        self._key = key
+        self._encryptor = None
+        self._chain = _ZERO_BLOCK
+
+    def _encrypt(self, body: bytearray) -> bytes:
+        """Encrypt a message in CBC mode with a zero IV, reusing one cipher for the session.
+
+        The cipher chains from the last block it encrypted, so the first
+        block is combined with that block beforehand to cancel it out.
+        """
+        if self._encryptor is None:
+            self._encryptor = AES.new(self._key, AES.MODE_CBC, iv=_ZERO_BLOCK)
+        body[:BLOCK_SIZE] = strxor(body[:BLOCK_SIZE], self._chain)
+        encrypted = self._encryptor.encrypt(body)
+        self._chain = encrypted[-BLOCK_SIZE:]
+        return encrypted
+
+    def handshake(self, response, key: bytes) -> bool:
+        """Derive the session key from the 64 byte reply to a handshake request."""
+        if len(response) != 64:
+            return False
+
+        response = memoryview(response)
+        plain = cbc_decrypt(response[:32], key)
+        if sha256(plain).digest() != response[32:]:
+            return False
+
+        self.key = strxor(plain, key)
+        self.request_count = 0
+        self.response_count = 0
+        return True
+
+    def encode(self, data, msgtype: int) -> bytes:
+        """Wrap data in a 0x8370 message, encrypted and signed unless it's part of the handshake."""
+        encrypted = msgtype in (MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_ENCRYPTED_RESPONSE)
+
+        padding = 0
+        size = len(data)
+        if encrypted:
+            padding = -(size + V3_COUNTER_LENGTH) % BLOCK_SIZE
+            size += padding + V3_SIGN_LENGTH
+
+        header = bytes((0x83, 0x70, size >> 8 & 0xFF, size & 0xFF, 0x20, padding << 4 | msgtype))
+
+        if self.request_count >= V3_MAX_COUNT:
+            self.request_count = 0
+        body = bytearray(V3_COUNTER_LENGTH + len(data) + padding)
+        body[0:V3_COUNTER_LENGTH] = self.request_count.to_bytes(V3_COUNTER_LENGTH, "big")
+        body[V3_COUNTER_LENGTH:V3_COUNTER_LENGTH + len(data)] = data
+        if padding:
+            body[-padding:] = os.urandom(padding)
+        self.request_count += 1
+
+        if not encrypted:
+            return header + body
+
+        sign = sha256(header)
+        sign.update(body)
+        return b"".join((header, self._encrypt(body), sign.digest()))
+
+    def decode(self, data) -> tuple[list[bytes], bytes]:
+        """Decode the complete 0x8370 messages at the start of a buffer.
+
+        Returns their payloads and the remaining incomplete data. Raises
+        ValueError for malformed messages or bad signatures.
+        """
+        view = memoryview(data)
+        parsed = []
+        encrypted = []
+        offset = 0
+        while len(view) - offset >= V3_HEADER_LENGTH:
+            header = view[offset:offset + V3_HEADER_LENGTH]
+            if header[:2] != V3_MAGIC:
+                raise ValueError("Not a V3 message")
+
+            size = (header[2] << 8 | header[3]) + 8
+            if len(view) - offset < size:
+                break
+            if header[4] != 0x20:
+                raise ValueError("Invalid V3 message header")
+
+            msgtype = header[5] & 0xF
+            body = view[offset + V3_HEADER_LENGTH:offset + size]
+            if msgtype in (MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_ENCRYPTED_RESPONSE):
+                if self.key is None:
+                    raise ValueError("Encrypted V3 message without a session key")
+                ciphertext = body[:-V3_SIGN_LENGTH]
+                if not len(ciphertext) or len(ciphertext) % BLOCK_SIZE:
+                    raise ValueError("Truncated V3 message")
+                encrypted.append(ciphertext)
+            parsed.append((header, body, msgtype))
+            offset += size
+
+        # Decrypt the bodies of all messages in the buffer at once
+        if encrypted:
+            plain = memoryview(cbc_decrypt_messages(encrypted, self.key))
+            plain_offset = 0
+
+        messages = []
+        for header, body, msgtype in parsed:
+            if msgtype in (MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_ENCRYPTED_RESPONSE):
+                sign = body[-V3_SIGN_LENGTH:]
+                size = len(body) - V3_SIGN_LENGTH
+                body = plain[plain_offset:plain_offset + size]
+                plain_offset += size
+
+                expected = sha256(header)
+                expected.update(body)
+                if expected.digest() != sign:
+                    raise ValueError("V3 message signature does not match")
+                if padding := header[5] >> 4:
+                    body = body[:-padding]
+
+            if len(body) < V3_COUNTER_LENGTH:
+                raise ValueError("Truncated V3 message")
+            self.response_count = body[0] << 8 | body[1]
+            messages.append(bytes(body[V3_COUNTER_LENGTH:]))
+        return messages, bytes(view[offset:])
@@ -1,12 +1,13 @@
 """Config flow for Midea Smart AC."""
 from __future__ import annotations
 
+from ipaddress import IPv4Network
+
 from homeassistant.config_entries import ConfigEntry, ConfigFlow, OptionsFlow
 from homeassistant.const import CONF_HOST, CONF_ID, CONF_PORT, CONF_TOKEN
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 import homeassistant.helpers.config_validation as cv
-from msmart.device import air_conditioning as ac
 import voluptuous as vol
 
 # Local constants
@@ -17,13 +18,39 @@ from .const import (
     CONF_TEMP_STEP,
     CONF_INCLUDE_OFF_AS_STATE,
     CONF_USE_FAN_ONLY_WORKAROUND,
-    CONF_KEEP_LAST_KNOWN_ONLINE_STATE
+    CONF_KEEP_LAST_KNOWN_ONLINE_STATE,
+    CONF_APPLY_DELAY,
+    CONF_OPTIMISTIC_STATE,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_DEADBAND,
+    CONF_MIN_WRITE_INTERVAL,
+    CONF_SUBNETS,
+    CONF_CLOUD_CREDENTIALS,
+    DEFAULT_APPLY_DELAY,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DEFAULT_DEADBAND,
+    DEFAULT_MIN_WRITE_INTERVAL
 )
+from .device import MideaDevice
+from .discovery import async_get_cloud_credentials, async_get_discovery
 
 
 class MideaConfigFlow(ConfigFlow, domain=DOMAIN):
 
-    async def async_step_user(self, user_input) -> FlowResult:
+    def __init__(self) -> None:
+        self._discovered = {}
+        self._defaults = {}
+
+    async def async_step_user(self, user_input=None) -> FlowResult:
+        # Flows started with data skip the menu
+        if user_input is not None:
+            return await self.async_step_manual(user_input)
+
+        return self.async_show_menu(step_id="user", menu_options=["discover", "manual"])
+
+    async def async_step_manual(self, user_input=None) -> FlowResult:
         errors = {}
         if user_input is not None:
             # Set the unique ID and abort if duplicate exists
@@ -35,35 +62,14 @@ class MideaConfigFlow(ConfigFlow, domain=DOMAIN):
             device = await self._test_connection(user_input)
 
             if device:
-                # Save the device into global data
-                self.hass.data.setdefault(DOMAIN, {})
-                self.hass.data[DOMAIN][id] = device
-
-                # Split user input config data and options
-                data = {
-                    CONF_ID: id,
-                    CONF_HOST: user_input.get(CONF_HOST),
-                    CONF_PORT: user_input.get(CONF_PORT),
-                    CONF_TOKEN: user_input.get(CONF_TOKEN),
-                    CONF_K1: user_input.get(CONF_K1),
-                }
-                options = {
-                    CONF_PROMPT_TONE: user_input.get(CONF_PROMPT_TONE),
-                    CONF_TEMP_STEP: user_input.get(CONF_TEMP_STEP),
-                    CONF_INCLUDE_OFF_AS_STATE: user_input.get(CONF_INCLUDE_OFF_AS_STATE),
-                    CONF_USE_FAN_ONLY_WORKAROUND: user_input.get(CONF_USE_FAN_ONLY_WORKAROUND),
-                    CONF_KEEP_LAST_KNOWN_ONLINE_STATE: user_input.get(CONF_KEEP_LAST_KNOWN_ONLINE_STATE),
-                }
-
-                # Create a config entry with the config data and options
-                return self.async_create_entry(title=f"{DOMAIN} {id}", data=data, options=options)
+                return self._create_entry(user_input)
             else:
                 # Indicate a connection could not be made
                 errors["base"] = "cannot_connect"
 
-        
-        user_input = user_input or {}
-        
+        return self._show_manual_form(user_input or self._defaults, errors)
+
+    def _show_manual_form(self, user_input: dict, errors: dict) -> FlowResult:
         data_schema = vol.Schema({
             vol.Required(CONF_ID,
                          default=user_input.get(CONF_ID)): cv.string,
@@ -87,23 +93,142 @@ class MideaConfigFlow(ConfigFlow, domain=DOMAIN):
                          default=user_input.get(CONF_KEEP_LAST_KNOWN_ONLINE_STATE, False)):  cv.boolean
         })
 
-        return self.async_show_form(step_id="user", data_schema=data_schema, errors=errors)
+        return self.async_show_form(step_id="manual", data_schema=data_schema, errors=errors)
+
+    def _create_entry(self, user_input: dict) -> FlowResult:
+        # Split user input config data and options
+        id = user_input.get(CONF_ID)
+        data = {
+            CONF_ID: id,
+            CONF_HOST: user_input.get(CONF_HOST),
+            CONF_PORT: user_input.get(CONF_PORT),
+            CONF_TOKEN: user_input.get(CONF_TOKEN),
+            CONF_K1: user_input.get(CONF_K1),
+        }
+        options = {
+            CONF_PROMPT_TONE: user_input.get(CONF_PROMPT_TONE, True),
+            CONF_TEMP_STEP: user_input.get(CONF_TEMP_STEP, 1.0),
+            CONF_INCLUDE_OFF_AS_STATE: user_input.get(CONF_INCLUDE_OFF_AS_STATE, True),
+            CONF_USE_FAN_ONLY_WORKAROUND: user_input.get(CONF_USE_FAN_ONLY_WORKAROUND, False),
+            CONF_KEEP_LAST_KNOWN_ONLINE_STATE: user_input.get(CONF_KEEP_LAST_KNOWN_ONLINE_STATE, False),
+        }
+
+        # Create a config entry with the config data and options
+        return self.async_create_entry(title=f"{DOMAIN} {id}", data=data, options=options)
 
-    async def _test_connection(self, config) -> ac | None:
+    async def async_step_import(self, import_config: dict) -> FlowResult:
+        """Create an entry for a device listed in configuration.yaml or a CSV file."""
+        id = import_config[CONF_ID]
+        await self.async_set_unique_id(id)
+
+        # Follow address changes of devices that are already configured
+        self._abort_if_unique_id_configured(updates={
+            CONF_HOST: import_config[CONF_HOST],
+            CONF_PORT: import_config[CONF_PORT],
+        })
+
+        if not await self._test_connection(import_config):
+            return self.async_abort(reason="cannot_connect")
+
+        return self._create_entry(import_config)
+
+    async def async_step_discover(self, user_input=None) -> FlowResult:
+        errors = {}
+        if user_input is not None:
+            subnets = [s.strip() for s in user_input.get(CONF_SUBNETS, "").split(",") if s.strip()]
+            try:
+                for subnet in subnets:
+                    IPv4Network(subnet, strict=False)
+            except ValueError:
+                errors[CONF_SUBNETS] = "invalid_subnet"
+            else:
+                try:
+                    devices = await async_get_discovery(self.hass).async_discover(subnets)
+                except OSError:
+                    errors["base"] = "cannot_connect"
+                else:
+                    # Only offer devices that aren't configured yet
+                    configured = self._async_current_ids()
+                    self._discovered = {str(d.id): d for d in devices if str(d.id) not in configured}
+
+                    if self._discovered:
+                        return await self.async_step_pick_device()
+
+                    errors["base"] = "no_devices_found"
+
+        user_input = user_input or {}
+
+        data_schema = vol.Schema({
+            vol.Optional(CONF_SUBNETS,
+                         default=user_input.get(CONF_SUBNETS, "")): cv.string,
+        })
+
+        return self.async_show_form(step_id="discover", data_schema=data_schema, errors=errors)
+
+    async def async_step_pick_device(self, user_input=None) -> FlowResult:
+        if user_input is not None:
+            id = user_input[CONF_ID]
+            discovered = self._discovered[id]
+            await self.async_set_unique_id(id)
+            self._abort_if_unique_id_configured()
+
+            config = {
+                CONF_ID: id,
+                CONF_HOST: discovered.host,
+                CONF_PORT: discovered.port,
+            }
+
+            # V3 devices need a token and k1, which are only fetched from the cloud if asked to
+            if discovered.version == 3 and not user_input.get(CONF_CLOUD_CREDENTIALS, False):
+                self._defaults = config
+                return self._show_manual_form(config, {"base": "credentials_required"})
+
+            if discovered.version == 3:
+                candidates = await async_get_cloud_credentials(self.hass, discovered.id)
+            else:
+                candidates = [("", "")]
+
+            for token, k1 in candidates:
+                config.update({CONF_TOKEN: token, CONF_K1: k1})
+                if await self._test_connection(config):
+                    return self._create_entry(config)
+
+            # Let the user complete the configuration by hand
+            self._defaults = config
+            error = "cannot_connect" if candidates else "cloud_credentials_failed"
+            return self._show_manual_form(config, {"base": error})
+
+        devices = {
+            id: f"{d.model} {id} ({d.host})" for id, d in self._discovered.items()
+        }
+        data_schema = vol.Schema({
+            vol.Required(CONF_ID): vol.In(devices),
+            vol.Optional(CONF_CLOUD_CREDENTIALS, default=False): cv.boolean,
+        })
+
+        return self.async_show_form(step_id="pick_device", data_schema=data_schema)
+
+    async def _test_connection(self, config) -> MideaDevice | None:
         # Construct the device
         id = config.get(CONF_ID)
         host = config.get(CONF_HOST)
         port = config.get(CONF_PORT)
-        device = ac(host, int(id), port)
+        # Share the fleet request limiter if the integration is loaded
+        fleet = self.hass.data.get(DOMAIN)
+        device = MideaDevice(host, int(id), port,
+                             fleet.limiter if fleet else None)
 
         # Configure token and k1 as needed
         token = config.get(CONF_TOKEN)
         k1 = config.get(CONF_K1)
-        if token and k1:
-            success = await self.hass.async_add_executor_job(device.authenticate, k1, token)
-        else:
-            await self.hass.async_add_executor_job(device.refresh)
-            success = device.online
+        try:
+            if token and k1:
+                success = await device.async_authenticate(k1, token)
+            else:
+                await device.async_refresh()
+                success = device.online
+        finally:
+            await device.async_close()
 
         return device if success else None
 
@@ -135,7 +260,19 @@ class MideaOptionsFlow(OptionsFlow):
             vol.Optional(CONF_USE_FAN_ONLY_WORKAROUND,
                          default=options.get(CONF_USE_FAN_ONLY_WORKAROUND, False)):  cv.boolean,
             vol.Optional(CONF_KEEP_LAST_KNOWN_ONLINE_STATE,
-                         default=options.get(CONF_KEEP_LAST_KNOWN_ONLINE_STATE, False)):  cv.boolean
+                         default=options.get(CONF_KEEP_LAST_KNOWN_ONLINE_STATE, False)):  cv.boolean,
+            vol.Optional(CONF_APPLY_DELAY,
+                         default=options.get(CONF_APPLY_DELAY, DEFAULT_APPLY_DELAY)): vol.All(vol.Coerce(float), vol.Range(min=0, max=5)),
+            vol.Optional(CONF_OPTIMISTIC_STATE,
+                         default=options.get(CONF_OPTIMISTIC_STATE, False)): cv.boolean,
+            vol.Optional(CONF_MIN_SCAN_INTERVAL,
+                         default=options.get(CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL)): vol.All(vol.Coerce(int), vol.Range(min=1, max=300)),
+            vol.Optional(CONF_MAX_SCAN_INTERVAL,
+                         default=options.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL)): vol.All(vol.Coerce(int), vol.Range(min=1, max=3600)),
+            vol.Optional(CONF_DEADBAND,
+                         default=options.get(CONF_DEADBAND, DEFAULT_DEADBAND)): vol.All(vol.Coerce(float), vol.Range(min=0, max=5)),
+            vol.Optional(CONF_MIN_WRITE_INTERVAL,
+                         default=options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)): vol.All(vol.Coerce(int), vol.Range(min=0, max=3600))
         })
 
         return self.async_show_form(step_id="init", data_schema=data_schema)
@@ -5,4 +5,33 @@ CONF_PROMPT_TONE = "prompt_tone"
 CONF_TEMP_STEP = "temp_step"
 CONF_INCLUDE_OFF_AS_STATE = "include_off_as_state"
 CONF_USE_FAN_ONLY_WORKAROUND = "use_fan_only_workaround"
-CONF_KEEP_LAST_KNOWN_ONLINE_STATE = "keep_last_known_online_state"
\ No newline at end of file
+CONF_KEEP_LAST_KNOWN_ONLINE_STATE = "keep_last_known_online_state"
+CONF_APPLY_DELAY = "apply_delay"
+CONF_OPTIMISTIC_STATE = "optimistic_state"
+CONF_MIN_SCAN_INTERVAL = "min_scan_interval"
+CONF_MAX_SCAN_INTERVAL = "max_scan_interval"
+CONF_MAX_CONCURRENT_REQUESTS = "max_concurrent_requests"
+CONF_DEADBAND = "deadband"
+CONF_MIN_WRITE_INTERVAL = "min_write_interval"
+CONF_SUBNETS = "subnets"
+CONF_CLOUD_CREDENTIALS = "cloud_credentials"
+CONF_DEVICES_FILE = "devices_file"
+
+DEFAULT_APPLY_DELAY = 0.5
+DEFAULT_MIN_SCAN_INTERVAL = 5
+DEFAULT_MAX_SCAN_INTERVAL = 60
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+DEFAULT_DEADBAND = 0.0
+DEFAULT_MIN_WRITE_INTERVAL = 0
+
+SERVICE_START_TRACE = "start_trace"
+SERVICE_STOP_TRACE = "stop_trace"
+SERVICE_GROUP_APPLY = "group_apply"
+SERVICE_SNAPSHOT = "snapshot"
+SERVICE_RESTORE = "restore"
+
+ATTR_MAX_SPANS = "max_spans"
+ATTR_FILENAME = "filename"
+ATTR_MAX_PARALLEL = "max_parallel"
+ATTR_RETRIES = "retries"
+ATTR_SNAPSHOT = "snapshot"
@@ -0,0 +1,278 @@
+"""Update coordinator for Midea Smart AC."""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import random
+import time
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+# Local constants
+from .const import (
+    DOMAIN,
+    CONF_INCLUDE_OFF_AS_STATE,
+    CONF_USE_FAN_ONLY_WORKAROUND,
+    CONF_APPLY_DELAY,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    DEFAULT_APPLY_DELAY,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_MAX_SCAN_INTERVAL
+)
+from .breaker import MideaCircuitBreaker
+from .device import MideaDevice
+from .history import HISTORY_DURATION, MideaTemperatureHistory
+
+_LOGGER = logging.getLogger(__name__)
+
+SCAN_INTERVAL = datetime.timedelta(seconds=15)
+
+# Poll at the minimum interval for this long after a command or state change
+BURST_DURATION = datetime.timedelta(minutes=2)
+
+# Poll at the maximum interval once the state has been unchanged this long
+STABLE_DURATION = datetime.timedelta(minutes=10)
+
+# Maximum fraction each device's interval is stretched to spread polls
+JITTER_FRACTION = 0.1
+
+# Maximum time in seconds to wait for a device to confirm an apply
+APPLY_TIMEOUT = 15
+
+# Interval at which the connection for notifications is checked and reopened
+LISTEN_INTERVAL = datetime.timedelta(seconds=30)
+
+# Device properties whose recent samples are kept in memory
+HISTORY_PROPERTIES = ("indoor_temperature", "outdoor_temperature")
+
+
+class MideaDeviceUpdateCoordinator(DataUpdateCoordinator):
+    """Coordinator that refreshes a single device for all of its entities."""
+
+    def __init__(self, hass: HomeAssistant, device: MideaDevice, options: dict) -> None:
+        self._use_fan_only_workaround = options.get(
+            CONF_USE_FAN_ONLY_WORKAROUND, False)
+
+        # Refreshing turns some devices on in fan_only mode, so disable polling
+        interval = None if self._use_fan_only_workaround else SCAN_INTERVAL
+
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN}_{device.id}",
+            update_interval=interval,
+        )
+
+        self.device = device
+
+        # Whether off is an HVAC mode of the device's entity rather than only a power state
+        self.include_off_as_state = options.get(CONF_INCLUDE_OFF_AS_STATE, True)
+
+        # Entities are unavailable until the first refresh succeeds
+        self.last_update_success = False
+
+        # Polling becomes a fallback once the device is seen pushing its state
+        self._push_received = False
+        device.set_notify_callback(self._async_handle_notification)
+
+        # Bounds of the adaptive scan interval
+        self._min_interval = datetime.timedelta(seconds=options.get(
+            CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL))
+        self._max_interval = max(self._min_interval, datetime.timedelta(seconds=options.get(
+            CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL)))
+
+        # Stable per-device jitter so devices don't all poll at the same moment
+        self._jitter = 1 + random.Random(device.id).uniform(0, JITTER_FRACTION)
+
+        # Random phase of the first scheduled poll, so devices set up together don't poll in lockstep
+        self._phase = random.random()
+
+        # Start at the regular interval until activity is observed
+        self._last_state = None
+        self._last_change = time.monotonic() - BURST_DURATION.total_seconds()
+
+        # Back off from the device while it keeps failing
+        self.breaker = MideaCircuitBreaker(device.id)
+
+        # Recent temperatures at poll resolution for trend attributes
+        capacity = int(HISTORY_DURATION / self._min_interval) + 1
+        self.history = {prop: MideaTemperatureHistory(capacity) for prop in HISTORY_PROPERTIES}
+
+        # Changes made within the delay are merged into a single apply
+        self._apply_delay = options.get(CONF_APPLY_DELAY, DEFAULT_APPLY_DELAY)
+        self._pending_apply = None
+
+    def _next_interval(self) -> datetime.timedelta:
+        """Determine the next scan interval from recent device activity."""
+        idle_time = time.monotonic() - self._last_change
+
+        if self.breaker.is_open:
+            # Probe an unreachable device at the backoff interval
+            interval = max(self.breaker.backoff, self._max_interval)
+        elif self._push_received:
+            interval = self._max_interval
+        elif idle_time < BURST_DURATION.total_seconds():
+            interval = self._min_interval
+        elif not self.device.power_state or idle_time > STABLE_DURATION.total_seconds():
+            interval = self._max_interval
+        else:
+            interval = min(max(SCAN_INTERVAL, self._min_interval),
+                           self._max_interval)
+
+        interval *= self._jitter
+
+        # Delay only the first scheduled poll by up to one more interval
+        if self._phase:
+            interval *= 1 + self._phase
+            self._phase = 0
+
+        return interval
+
+    @callback
+    def async_notify_command(self) -> None:
+        """Poll quickly for a while after a command was sent to the device."""
+        self._last_change = time.monotonic()
+        self._last_state = self.device.state
+
+        if self.update_interval is not None:
+            self.update_interval = self._next_interval()
+
+    @property
+    def apply_pending(self) -> bool:
+        """Check if local changes are waiting to be applied."""
+        return self._pending_apply is not None
+
+    async def async_apply(self) -> bool:
+        """Apply the local state to the device, merging changes made within the apply delay.
+
+        Returns True if the device confirmed the changes.
+        """
+        # Schedule an apply if one isn't already waiting for changes
+        if self._pending_apply is None:
+            self._pending_apply = self.hass.async_create_task(
+                self._async_apply_pending())
+
+        # Shield the shared apply so a cancelled caller doesn't cancel it for others
+        return await asyncio.shield(self._pending_apply)
+
+    async def _async_apply_pending(self) -> bool:
+        """Wait for further changes then apply them all at once."""
+        await asyncio.sleep(self._apply_delay)
+
+        # Changes made from here on will schedule another apply
+        self._pending_apply = None
+
+        # Fail fast instead of waiting on a device that is known to be unreachable
+        if not self.breaker.allow_request():
+            _LOGGER.warning("Not applying changes to unreachable device %s.",
+                            self.device.id)
+            self._async_set_apply_failed()
+            return False
+
+        try:
+            success = await asyncio.wait_for(self.device.async_apply(), APPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            _LOGGER.warning("Timed out applying changes to device %s.",
+                            self.device.id)
+            self.device.metrics.timeouts += 1
+            success = False
+
+        self.breaker.record(success)
+
+        self.async_notify_command()
+
+        if success:
+            # The reply holds the full state so it counts as a completed poll
+            self._record_history()
+
+            # Updates all entities of the device and pushes back the next poll
+            self.async_set_updated_data(self.device)
+        else:
+            self._async_set_apply_failed()
+
+        return success
+
+    @callback
+    def _async_set_apply_failed(self) -> None:
+        """Mark the device unavailable if a failed apply shows it is offline or unreachable."""
+        if self.breaker.is_open and not self._use_fan_only_workaround:
+            self.async_set_update_error(UpdateFailed(f"Device {self.device.id} is unreachable."))
+        elif not self.device.online:
+            self.async_set_update_error(UpdateFailed(f"Device {self.device.id} is offline."))
+
+    async def async_listen(self) -> None:
+        """Keep a connection to the device open to receive its notifications."""
+        while True:
+            # Failing to reach the device backs off like a failed poll
+            if not self.breaker.is_open and not await self.device.async_connect():
+                self.breaker.record(False)
+            await asyncio.sleep(LISTEN_INTERVAL.total_seconds())
+
+    @callback
+    def _async_handle_notification(self, frames: list[bytes]) -> None:
+        """Push state the device sent on its own, like changes made with the remote."""
+        # Local changes waiting to be applied take precedence
+        if self.apply_pending:
+            return
+
+        if not self.device.process_notification(frames):
+            return
+
+        if not self._push_received:
+            _LOGGER.info("Device %s pushes state changes, polling only as a fallback.",
+                         self.device.id)
+            self._push_received = True
+
+        self.breaker.record(True)
+        self._record_history()
+
+        state = self.device.state
+        if state != self._last_state:
+            self._last_change = time.monotonic()
+        self._last_state = state
+
+        if self.update_interval is not None:
+            self.update_interval = self._next_interval()
+
+        # Updates entities and restarts the poll timer
+        self.async_set_updated_data(self.device)
+
+    def _record_history(self) -> None:
+        now = time.time()
+        for prop, history in self.history.items():
+            if (value := getattr(self.device, prop)) is not None:
+                history.append(now, value)
+
+    async def _async_update_data(self) -> MideaDevice:
+        """Refresh the device state."""
+        # Don't overwrite local changes waiting to be applied, the result of
+        # the apply decides whether the device is still available
+        if not self.apply_pending and not self._use_fan_only_workaround:
+            if not self.breaker.allow_request():
+                raise UpdateFailed(f"Device {self.device.id} is unreachable.")
+
+            success = await self.device.async_refresh()
+            self.breaker.record(success)
+
+            # Track state changes to adapt the scan interval
+            state = self.device.state
+            if self._last_state is not None and state != self._last_state:
+                self._last_change = time.monotonic()
+            self._last_state = state
+
+            self.update_interval = self._next_interval()
+
+            if success:
+                self._record_history()
+
+        # Report the device unavailable even if failures are masked
+        if self.breaker.is_open and not self._use_fan_only_workaround:
+            raise UpdateFailed(f"Device {self.device.id} is unreachable.")
+
+        if not self.device.online:
+            raise UpdateFailed(f"Device {self.device.id} is offline.")
+
+        return self.device
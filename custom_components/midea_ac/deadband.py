@@ -0,0 +1,52 @@
+"""Deadband filtering of entity state writes for Midea Smart AC."""
+from __future__ import annotations
+
+import time
+
+
+class MideaDeadbandFilter:
+    """Decide whether an entity state differs enough from the last written one.
+
+    The measured value is compared against the deadband, every other part of
+    the state must match exactly. When a minimum write interval is set, the
+    state is written again once it has elapsed even if nothing changed.
+    Filtering is disabled while both the deadband and the interval are zero.
+    """
+
+    def __init__(self, deadband: float = 0, min_write_interval: float = 0) -> None:
+        self._deadband = deadband
+        self._min_write_interval = min_write_interval
+
+        self._written = False
+        self._value = None
+        self._state = None
+        self._time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._deadband > 0 or self._min_write_interval > 0
+
+    def record(self, value: float | None, state: tuple = ()) -> None:
+        """Remember a state that was written without consulting the filter."""
+        self._written = True
+        self._value = value
+        self._state = state
+        self._time = time.monotonic()
+
+    def should_write(self, value: float | None, state: tuple = ()) -> bool:
+        """Return true and record the state if it should be written."""
+        if not self.enabled:
+            return True
+
+        if self._written and state == self._state and not self._value_changed(value):
+            elapsed = time.monotonic() - self._time
+            if not self._min_write_interval or elapsed < self._min_write_interval:
+                return False
+
+        self.record(value, state)
+        return True
+
+    def _value_changed(self, value: float | None) -> bool:
+        if value is None or self._value is None:
+            return value != self._value
+        return abs(value - self._value) >= self._deadband if self._deadband else value != self._value
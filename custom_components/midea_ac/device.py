@@ -0,0 +1,195 @@
+"""Asyncio device for Midea Smart AC."""
+from __future__ import annotations
+
+import logging
+import time
+
+from msmart.device import air_conditioning as ac
+from msmart.device.AC.command import ResponseId, get_capabilities_command, get_state_command, set_state_command
+
+from . import codec
+from .lan import MideaLan
+from .metrics import MideaDeviceMetrics
+from .tracing import MideaTracer
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MideaDevice(ac):
+    """Air conditioner that communicates over a persistent asyncio LAN connection."""
+
+    def __init__(self, host: str, device_id: int, port: int, limiter=None,
+                 tracer: MideaTracer | None = None) -> None:
+        super().__init__(host, device_id, port)
+
+        self.metrics = MideaDeviceMetrics()
+        self._tracer = tracer or MideaTracer()
+        self._lan = MideaLan(host, device_id, port, limiter, self.metrics, self._tracer)
+
+        self._capabilities_received = False
+        self._state_received = False
+
+    def set_credentials(self, k1: str, token: str) -> None:
+        """Configure V3 credentials, authenticating lazily on the first request."""
+        self._protocol_version = 3
+        self._token = bytes.fromhex(token)
+        self._key = bytes.fromhex(k1)
+        self._lan.set_credentials(self._token, self._key)
+
+    def set_notify_callback(self, callback) -> None:
+        """Set a callback receiving frames the device sends on its own."""
+        self._lan.set_notify_callback(callback)
+
+    async def async_connect(self) -> bool:
+        """Open the connection to receive notifications, authenticating if necessary."""
+        return await self._lan.connect()
+
+    def process_notification(self, frames: list[bytes]) -> bool:
+        """Update the state from unsolicited frames. Returns True if they held the state."""
+        self._state_received = False
+        with self._tracer.span("decode", self.id, responses=len(frames)):
+            for frame in sorted(frames):
+                # Other notifications, like the periodic 0xA0 and 0xA1 reports, aren't decoded by msmart
+                if frame[10] != ResponseId.State:
+                    _LOGGER.debug("Ignoring notification %s from %s:%d.",
+                                  frame.hex(), self.ip, self.port)
+                    continue
+                self._process_response(frame)
+        return self._state_received
+
+    async def async_authenticate(self, k1: str, token: str) -> bool:
+        """Authenticate with a V3 device immediately."""
+        self.set_credentials(k1, token)
+        return await self._lan.authenticate()
+
+    async def async_get_capabilities(self) -> bool:
+        """Query the device capabilities. Returns True if the device replied with them."""
+        async def query() -> bool:
+            self._capabilities_received = False
+            self._state_received = False
+            await self._async_send_cmd(get_capabilities_command(self.type))
+            return self._capabilities_received
+
+        return await self._async_measure("capabilities", query())
+
+    def update_capabilities(self, res) -> None:
+        super().update_capabilities(res)
+        self._capabilities_received = True
+
+    @property
+    def capabilities(self) -> dict:
+        """Capabilities of the device in a serializable form."""
+        return {
+            "operation_modes": [getattr(m, "name", m) for m in self.supported_operation_modes],
+            "swing_modes": [getattr(m, "name", m) for m in self.supported_swing_modes],
+            "eco_mode": getattr(self, "_supports_eco", True),
+            "turbo_mode": getattr(self, "_supports_turbo", True),
+        }
+
+    def restore_capabilities(self, capabilities: dict) -> None:
+        """Restore capabilities previously returned by the capabilities property."""
+        self._supported_op_modes = [
+            ac.operational_mode_enum[m] for m in capabilities["operation_modes"]]
+        self._supported_swing_modes = [
+            ac.swing_mode_enum[m] for m in capabilities["swing_modes"]]
+        self._supports_eco = capabilities["eco_mode"]
+        self._supports_turbo = capabilities["turbo_mode"]
+
+    def update(self, res) -> None:
+        super().update(res)
+        self._state_received = True
+
+    @property
+    def state(self) -> dict:
+        """User controllable state of the device."""
+        return {
+            "power_state": self.power_state,
+            "operational_mode": self.operational_mode,
+            "target_temperature": self.target_temperature,
+            "fan_speed": self.fan_speed,
+            "swing_mode": self.swing_mode,
+            "eco_mode": self.eco_mode,
+            "turbo_mode": self.turbo_mode,
+        }
+
+    def restore_state(self, state: dict) -> None:
+        """Restore local state previously returned by the state property."""
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    async def async_refresh(self) -> bool:
+        """Refresh the device state. Returns True if the device replied with its state."""
+        async def refresh() -> bool:
+            self._state_received = False
+            await self._async_send_cmd(get_state_command(self.type))
+            return self._state_received
+
+        return await self._async_measure("refresh", refresh())
+
+    async def async_apply(self) -> bool:
+        """Apply the local state to the device. Returns True if the device replied with its state."""
+        async def apply() -> bool:
+            self._state_received = False
+            cmd = set_state_command(self.type)
+            cmd.beep_on = self.prompt_tone
+            cmd.power_on = self.power_state
+            cmd.target_temperature = self.target_temperature
+            cmd.operational_mode = self.operational_mode
+            cmd.fan_speed = self.fan_speed
+            cmd.swing_mode = self.swing_mode
+            cmd.eco_mode = self.eco_mode
+            cmd.turbo_mode = self.turbo_mode
+            cmd.fahrenheit = self.fahrenheit
+            await self._async_send_cmd(cmd)
+            return self._state_received
+
+        return await self._async_measure("apply", apply())
+
+    async def _async_measure(self, operation: str, coro) -> bool:
+        """Await an operation, recording its latency and outcome in the metrics."""
+        start = time.monotonic()
+        success = False
+        try:
+            with self._tracer.span(operation, self.id):
+                success = await coro
+            return success
+        finally:
+            # Cancelled operations count as failures
+            self.metrics.record(operation, time.monotonic() - start, success)
+
+    async def async_close(self) -> None:
+        """Close the connection to the device."""
+        await self._lan.close()
+
+    async def _async_send_cmd(self, cmd) -> None:
+        span = self._tracer.span
+
+        with span("encode", self.id):
+            frame = cmd.pack()
+        with span("encrypt", self.id, protocol=2):
+            data = codec.encode_packet(self.id, frame)
+
+        send_time = time.monotonic()
+        responses = await self._lan.send(data)
+        request_time = time.monotonic() - send_time
+
+        _LOGGER.debug("Got %d responses from %s:%d in %.2f seconds.",
+                      len(responses), self.ip, self.port, request_time)
+
+        if len(responses) == 0:
+            _LOGGER.warning("No response from %s:%d in %.2f seconds.",
+                            self.ip, self.port, request_time)
+            self._active = False
+            self._support = False
+            if not self.keep_last_known_online_state:
+                self._online = False
+            else:
+                self.metrics.masked_failures += 1
+            return
+
+        # Process query responses last so the final state wins
+        responses.sort()
+        self._last_responses = responses
+        with span("decode", self.id, responses=len(responses)):
+            for response in responses:
+                self._process_response(response)
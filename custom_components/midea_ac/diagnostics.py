@@ -0,0 +1,50 @@
+"""Diagnostics support for Midea Smart AC."""
+from __future__ import annotations
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_ID, CONF_TOKEN
+from homeassistant.core import HomeAssistant
+
+# Local constants
+from .const import DOMAIN, CONF_K1
+
+# Credentials are never included in diagnostics
+REDACT_CONFIG = {CONF_TOKEN, CONF_K1}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, config_entry: ConfigEntry) -> dict:
+    """Return diagnostics of a Midea AC config entry."""
+    fleet = hass.data[DOMAIN]
+    coordinator = fleet.coordinators.get(config_entry.data.get(CONF_ID))
+
+    diagnostics = {
+        "config": async_redact_data(config_entry.data, REDACT_CONFIG),
+        "options": dict(config_entry.options),
+        "fleet": {
+            "devices": len(fleet.coordinators),
+            "limiter": fleet.limiter.stats,
+        },
+    }
+
+    if coordinator is None:
+        return diagnostics
+
+    device = coordinator.device
+    diagnostics["device"] = {
+        "online": device.online,
+        "protocol_version": device._protocol_version,
+        "state": {key: getattr(value, "name", value) for key, value in device.state.items()},
+        "capabilities": device.capabilities,
+        "indoor_temperature": device.indoor_temperature,
+        "outdoor_temperature": device.outdoor_temperature,
+    }
+    diagnostics["coordinator"] = {
+        "last_update_success": coordinator.last_update_success,
+        "update_interval": coordinator.update_interval.total_seconds() if coordinator.update_interval else None,
+        "apply_pending": coordinator.apply_pending,
+        "circuit_breaker": coordinator.breaker.as_dict(),
+    }
+    diagnostics["metrics"] = device.metrics.as_dict()
+
+    return diagnostics
@@ -0,0 +1,241 @@
+"""Asynchronous LAN discovery of Midea Smart AC devices."""
+from __future__ import annotations
+
+import asyncio
+import datetime
+from ipaddress import IPv4Network
+from itertools import chain, zip_longest
+import logging
+import time
+
+from homeassistant.components import network
+from homeassistant.core import HomeAssistant
+from msmart.const import BROADCAST_MSG, OPEN_MIDEA_APP_ACCOUNT, OPEN_MIDEA_APP_PASSWORD
+from msmart.scanner import gettoken
+from msmart.security import get_udpid
+
+# Local constants
+from . import codec
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# Ports answering discovery requests, the second one is used by older firmware
+DISCOVERY_PORTS = (6445, 20086)
+
+# Seconds to wait for replies after the last request was sent
+DISCOVERY_TIMEOUT = 3
+
+# Age after which discovered devices are forgotten and networks scanned again
+DISCOVERY_TTL = datetime.timedelta(minutes=5)
+
+# Bound on unicast requests sent per second while scanning subnets
+SCAN_RATE = 500
+
+# Number of requests sent between pauses to honor the scan rate
+SCAN_BATCH = 50
+
+# Largest number of addresses scanned at once
+MAX_SCAN_HOSTS = 4096
+
+DATA_DISCOVERY = f"{DOMAIN}_discovery"
+
+
+class MideaDiscoveredDevice:
+    """Device that replied to a discovery request."""
+
+    def __init__(self, id: int, host: str, port: int, version: int, sn: str, ssid: str) -> None:
+        self.id = id
+        self.host = host
+        self.port = port
+        self.version = version
+        self.sn = sn
+        self.ssid = ssid
+
+    @property
+    def model(self) -> str:
+        return self.sn[9:14]
+
+    @property
+    def type(self) -> str:
+        # SSID looks like midea_ac_xxxx or net_ac_xxxx
+        parts = self.ssid.split("_")
+        return parts[1] if len(parts) > 1 else ""
+
+    def __repr__(self) -> str:
+        return f"MideaDiscoveredDevice(id={self.id}, host={self.host}, port={self.port}, version={self.version})"
+
+
+def parse_discovery_reply(data: bytes) -> MideaDiscoveredDevice | None:
+    """Decode the reply of a V2 or V3 device to a discovery request."""
+    if data[:2] == b"\x83\x70":
+        version = 3
+        data = data[8:-16]
+    elif data[:2] == b"\x5a\x5a":
+        version = 2
+    else:
+        # V1 devices reply with XML and are not supported
+        return None
+
+    if len(data) < 104 or data[:2] != b"\x5a\x5a":
+        return None
+
+    reply = codec.decrypt_payload(memoryview(data)[40:-16])
+    if len(reply) < 41:
+        return None
+
+    try:
+        return MideaDiscoveredDevice(
+            id=int.from_bytes(data[20:26], "little"),
+            host=".".join(str(i) for i in reply[3::-1]),
+            port=int.from_bytes(reply[4:8], "little"),
+            version=version,
+            sn=reply[11:40].decode("utf-8"),
+            ssid=reply[41:41 + reply[40]].decode("utf-8"),
+        )
+    except UnicodeDecodeError:
+        return None
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    """Pass replies to discovery requests to a callback."""
+
+    def __init__(self, callback) -> None:
+        self._callback = callback
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self._callback(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        _LOGGER.debug("Discovery socket error: %s", exc)
+
+
+def _broadcast_addresses(adapters: list) -> list:
+    """Broadcast address of each private IPv4 network of the enabled adapters."""
+    addresses = set()
+    for adapter in adapters:
+        if not adapter["enabled"]:
+            continue
+        for ip in adapter["ipv4"]:
+            if ip["network_prefix"] >= 32:
+                continue
+            net = IPv4Network(f"{ip['address']}/{ip['network_prefix']}", strict=False)
+            if net.is_private and not net.is_loopback and not net.is_link_local:
+                addresses.add(str(net.broadcast_address))
+    return sorted(addresses)
+
+
+def _scan_addresses(subnets: list) -> list:
+    """Interleave the hosts of each subnet so they are scanned concurrently."""
+    hosts = [IPv4Network(subnet, strict=False).hosts() for subnet in subnets]
+    addresses = []
+    for address in chain.from_iterable(zip_longest(*hosts)):
+        if address is None:
+            continue
+        if len(addresses) == MAX_SCAN_HOSTS:
+            _LOGGER.warning("Scanning only the first %d addresses of %s.",
+                            MAX_SCAN_HOSTS, ", ".join(subnets))
+            break
+        addresses.append(str(address))
+    return addresses
+
+
+class MideaDiscovery:
+    """Broadcast and scan for devices, remembering replies for a while."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self._devices = {}
+        self._scanned = {}
+        self._lock = asyncio.Lock()
+
+    async def async_discover(self, subnets: list | None = None) -> list:
+        """Return devices replying to a broadcast or a scan of the subnets.
+
+        Raises OSError if the discovery socket can't be opened.
+        """
+        subnets = sorted(subnets or [])
+        key = tuple(subnets)
+
+        # Concurrent callers share a single scan
+        async with self._lock:
+            now = time.monotonic()
+            if now - self._scanned.get(key, -DISCOVERY_TTL.total_seconds()) > DISCOVERY_TTL.total_seconds():
+                await self._async_scan(subnets)
+                self._scanned[key] = time.monotonic()
+
+        now = time.monotonic()
+        self._devices = {id: entry for id, entry in self._devices.items() if entry[0] > now}
+        return [device for _, device in self._devices.values()]
+
+    def _on_reply(self, data: bytes, addr: tuple) -> None:
+        if (device := parse_discovery_reply(data)) is None:
+            _LOGGER.debug("Ignoring discovery reply from %s: %s", addr[0], data.hex())
+            return
+
+        if device.type != "ac":
+            _LOGGER.debug("Ignoring discovered device %s of type '%s'.", device.id, device.type)
+            return
+
+        if device.id not in self._devices:
+            _LOGGER.info("Discovered device %s at %s:%d.", device.id, device.host, device.port)
+        self._devices[device.id] = (time.monotonic() + DISCOVERY_TTL.total_seconds(), device)
+
+    async def _async_scan(self, subnets: list) -> None:
+        broadcasts = _broadcast_addresses(await network.async_get_adapters(self._hass))
+        addresses = _scan_addresses(subnets)
+
+        loop = asyncio.get_running_loop()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DiscoveryProtocol(self._on_reply),
+                local_addr=("0.0.0.0", 0), allow_broadcast=True)
+        except OSError as e:
+            _LOGGER.error("Failed to open discovery socket: %s", e)
+            raise
+
+        def send(address: str) -> None:
+            for port in DISCOVERY_PORTS:
+                transport.sendto(BROADCAST_MSG, (address, port))
+
+        try:
+            for address in broadcasts:
+                send(address)
+
+            for i in range(0, len(addresses), SCAN_BATCH):
+                for address in addresses[i:i + SCAN_BATCH]:
+                    send(address)
+                await asyncio.sleep(SCAN_BATCH / SCAN_RATE)
+
+            await asyncio.sleep(DISCOVERY_TIMEOUT)
+        finally:
+            transport.close()
+
+
+async def async_get_cloud_credentials(hass: HomeAssistant, id: int) -> list:
+    """Fetch candidate token and k1 pairs of a V3 device from the Midea cloud.
+
+    The cloud identifies devices by a hash of their ID whose byte order
+    depends on the firmware, so both are tried.
+    """
+    credentials = []
+    for byteorder in ("little", "big"):
+        udpid = get_udpid(id.to_bytes(6, byteorder))
+        try:
+            token, k1 = await hass.async_add_executor_job(
+                gettoken, udpid, OPEN_MIDEA_APP_ACCOUNT, OPEN_MIDEA_APP_PASSWORD)
+        except Exception as e:
+            _LOGGER.warning("Failed to fetch token of device %s from the cloud: %s", id, e)
+            break
+        if token and k1:
+            credentials.append((token, k1))
+    return credentials
+
+
+def async_get_discovery(hass: HomeAssistant) -> MideaDiscovery:
+    """Return the shared discovery, whose cache outlives config flows."""
+    if (discovery := hass.data.get(DATA_DISCOVERY)) is None:
+        discovery = MideaDiscovery(hass)
+        hass.data[DATA_DISCOVERY] = discovery
+
+    return discovery
@@ -0,0 +1,85 @@
+"""Fleet of Midea Smart AC devices sharing a bounded request queue."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import datetime
+import logging
+import time
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .tracing import MideaTracer
+
+_LOGGER = logging.getLogger(__name__)
+
+# Interval at which queue statistics are logged
+REPORT_INTERVAL = datetime.timedelta(minutes=1)
+
+# Number of recent wait times kept for statistics
+WAIT_TIME_SAMPLES = 1000
+
+
+class MideaRequestLimiter:
+    """Bound the number of requests in flight across all devices."""
+
+    def __init__(self, max_in_flight: int) -> None:
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._max_in_flight = max_in_flight
+        self._waiting = 0
+        self._in_flight = 0
+        self._requests = 0
+        self._wait_times = deque(maxlen=WAIT_TIME_SAMPLES)
+
+    async def __aenter__(self) -> None:
+        self._waiting += 1
+        start = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._wait_times.append(time.monotonic() - start)
+        self._in_flight += 1
+        self._requests += 1
+
+    async def __aexit__(self, *args) -> None:
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    @property
+    def stats(self) -> dict:
+        """Queue depth and wait time statistics."""
+        wait_times = sorted(self._wait_times)
+        count = len(wait_times)
+        return {
+            "max_in_flight": self._max_in_flight,
+            "in_flight": self._in_flight,
+            "queue_depth": self._waiting,
+            "requests": self._requests,
+            "wait_time_mean": sum(wait_times) / count if count else 0,
+            "wait_time_p99": wait_times[int(0.99 * (count - 1))] if count else 0,
+            "wait_time_max": wait_times[-1] if count else 0,
+        }
+
+
+class MideaFleet:
+    """All configured devices of the integration."""
+
+    def __init__(self, hass: HomeAssistant, max_in_flight: int) -> None:
+        self.limiter = MideaRequestLimiter(max_in_flight)
+        self.tracer = MideaTracer()
+        self.coordinators = {}
+
+        async_track_time_interval(hass, self._async_report, REPORT_INTERVAL)
+
+    @callback
+    def _async_report(self, now=None) -> None:
+        if not self.coordinators:
+            return
+
+        stats = self.limiter.stats
+        _LOGGER.debug("Fleet of %d devices: %d in flight, %d queued, mean wait %.3fs, p99 wait %.3fs.",
+                      len(self.coordinators), stats["in_flight"], stats["queue_depth"],
+                      stats["wait_time_mean"], stats["wait_time_p99"])
@@ -0,0 +1,154 @@
+"""Compact temperature history of Midea Smart AC devices."""
+from __future__ import annotations
+
+from array import array
+from collections import deque
+import datetime
+
+# Duration of history kept for the rolling mean, minimum and maximum
+HISTORY_DURATION = datetime.timedelta(hours=24)
+
+# Duration over which the rate of change is fitted
+RATE_WINDOW = datetime.timedelta(minutes=15)
+
+
+class MideaTemperatureHistory:
+    """Ring buffer of temperature samples with incrementally maintained aggregates.
+
+    Samples are stored in arrays that grow up to the capacity and then wrap.
+    Sums for the mean and the least squares rate of change are updated as
+    samples enter and leave their windows, and monotonic queues of sample
+    indices track the minimum and maximum, so every update is amortized O(1).
+    """
+
+    def __init__(self, capacity: int, duration: datetime.timedelta = HISTORY_DURATION,
+                 rate_window: datetime.timedelta = RATE_WINDOW) -> None:
+        self._capacity = capacity
+        self._duration = duration.total_seconds()
+        self._rate_window = rate_window.total_seconds()
+
+        self._times = array("d")
+        self._values = array("f")
+
+        # Absolute indices of the oldest sample and the next sample
+        self._head = 0
+        self._tail = 0
+
+        self._sum = 0.0
+        self._min = deque()
+        self._max = deque()
+
+        # Least squares sums of the rate window, times relative to an origin
+        self._rate_head = 0
+        self._origin = None
+        self._rate_sums = [0, 0.0, 0.0, 0.0, 0.0]
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def _time(self, index: int) -> float:
+        return self._times[index % self._capacity]
+
+    def _value(self, index: int) -> float:
+        return self._values[index % self._capacity]
+
+    def _add_rate(self, index: int, sign: int) -> None:
+        t = self._time(index) - self._origin
+        v = self._value(index)
+        sums = self._rate_sums
+        sums[0] += sign
+        sums[1] += sign * t
+        sums[2] += sign * v
+        sums[3] += sign * t * t
+        sums[4] += sign * t * v
+
+    def _evict(self) -> None:
+        index = self._head
+        self._sum -= self._value(index)
+        if self._min and self._min[0] == index:
+            self._min.popleft()
+        if self._max and self._max[0] == index:
+            self._max.popleft()
+        if self._rate_head == index:
+            self._add_rate(index, -1)
+            self._rate_head += 1
+        self._head += 1
+
+    def _rebase(self, now: float) -> None:
+        """Recompute the running sums to shed accumulated rounding errors."""
+        self._origin = now
+        self._sum = sum(self._value(i) for i in range(self._head, self._tail))
+        self._rate_sums = [0, 0.0, 0.0, 0.0, 0.0]
+        for i in range(self._rate_head, self._tail):
+            self._add_rate(i, 1)
+
+    def append(self, time: float, value: float) -> None:
+        """Add a sample taken at a time in seconds since the epoch."""
+        if len(self) == self._capacity:
+            self._evict()
+
+        position = self._tail % self._capacity
+        if position == len(self._times):
+            self._times.append(time)
+            self._values.append(value)
+        else:
+            self._times[position] = time
+            self._values[position] = value
+
+        # Read back the stored value so the sums match what later evictions subtract
+        value = self._values[position]
+        index = self._tail
+        self._tail += 1
+
+        self._sum += value
+        while self._min and self._value(self._min[-1]) >= value:
+            self._min.pop()
+        self._min.append(index)
+        while self._max and self._value(self._max[-1]) <= value:
+            self._max.pop()
+        self._max.append(index)
+
+        if self._origin is None:
+            self._origin = time
+        self._add_rate(index, 1)
+
+        # Drop samples that left their windows
+        while len(self) and self._time(self._head) < time - self._duration:
+            self._evict()
+        while self._rate_head < self._tail and self._time(self._rate_head) < time - self._rate_window:
+            self._add_rate(self._rate_head, -1)
+            self._rate_head += 1
+
+        if time - self._origin > self._duration:
+            self._rebase(time)
+
+    @property
+    def mean(self) -> float | None:
+        return self._sum / len(self) if len(self) else None
+
+    @property
+    def min(self) -> float | None:
+        return self._value(self._min[0]) if self._min else None
+
+    @property
+    def max(self) -> float | None:
+        return self._value(self._max[0]) if self._max else None
+
+    @property
+    def rate_of_change(self) -> float | None:
+        """Least squares slope over the rate window in degrees per hour."""
+        n, st, sv, stt, stv = self._rate_sums
+        denominator = n * stt - st * st
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * stv - st * sv) / denominator * 3600
+
+    @property
+    def stats(self) -> dict:
+        """Aggregates rounded to a tenth, so they don't change with every sample."""
+        return {
+            "mean": round(self.mean, 1) if self.mean is not None else None,
+            "min": round(self.min, 1) if self.min is not None else None,
+            "max": round(self.max, 1) if self.max is not None else None,
+            "rate_of_change": round(self.rate_of_change, 1) if self.rate_of_change is not None else None,
+        }
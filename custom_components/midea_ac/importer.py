@@ -0,0 +1,141 @@
+"""Bulk import of Midea Smart AC devices from configuration.yaml or CSV."""
+from __future__ import annotations
+
+import asyncio
+import csv
+import logging
+import time
+
+from homeassistant.components import persistent_notification
+from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.const import CONF_HOST, CONF_ID, CONF_PORT, CONF_TOKEN
+from homeassistant.core import HomeAssistant
+from homeassistant.data_entry_flow import FlowResultType
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+
+# Local constants
+from .const import (
+    DOMAIN,
+    CONF_K1,
+    CONF_PROMPT_TONE,
+    CONF_TEMP_STEP,
+    CONF_INCLUDE_OFF_AS_STATE,
+    CONF_USE_FAN_ONLY_WORKAROUND,
+    CONF_KEEP_LAST_KNOWN_ONLINE_STATE
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of devices validated at once
+IMPORT_CONCURRENCY = 16
+
+DEVICE_SCHEMA = vol.Schema({
+    vol.Required(CONF_ID): cv.string,
+    vol.Required(CONF_HOST): cv.string,
+    vol.Optional(CONF_PORT, default=6444): cv.port,
+    vol.Optional(CONF_TOKEN, default=""): vol.Any(None, cv.string),
+    vol.Optional(CONF_K1, default=""): vol.Any(None, cv.string),
+    vol.Optional(CONF_PROMPT_TONE): cv.boolean,
+    vol.Optional(CONF_TEMP_STEP): vol.All(vol.Coerce(float), vol.Range(min=0.5, max=5)),
+    vol.Optional(CONF_INCLUDE_OFF_AS_STATE): cv.boolean,
+    vol.Optional(CONF_USE_FAN_ONLY_WORKAROUND): cv.boolean,
+    vol.Optional(CONF_KEEP_LAST_KNOWN_ONLINE_STATE): cv.boolean,
+})
+
+# Readable outcome of each import flow result
+ABORT_REASONS = {
+    "already_configured": "already configured",
+    "cannot_connect": "connection failed",
+}
+
+
+def load_devices_csv(path: str) -> list:
+    """Read device rows from a CSV file with a header, run in the executor.
+
+    Returns a list of (row number, row) where empty cells are left out so
+    the device schema fills in defaults.
+    """
+    with open(path, newline="") as f:
+        return [
+            (number, {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()})
+            for number, row in enumerate(csv.DictReader(f), start=2)
+        ]
+
+
+async def async_import_devices(hass: HomeAssistant, devices: list, csv_path: str | None = None) -> list:
+    """Create config entries for devices, validating them concurrently.
+
+    A device that is invalid or can't be reached doesn't affect the others,
+    each gets a row in the returned results and a persistent notification.
+    """
+    start = time.monotonic()
+    results = []
+    configs = []
+
+    for config in devices:
+        configs.append((config[CONF_ID], config))
+
+    if csv_path is not None:
+        try:
+            rows = await hass.async_add_executor_job(load_devices_csv, csv_path)
+        except OSError as e:
+            _LOGGER.error("Failed to read devices from %s: %s", csv_path, e)
+            rows = []
+
+        for number, row in rows:
+            try:
+                config = DEVICE_SCHEMA(row)
+            except vol.Invalid as e:
+                results.append((row.get(CONF_ID, f"row {number}"), row.get(CONF_HOST, ""),
+                                f"invalid: {e}"))
+                continue
+            configs.append((config[CONF_ID], config))
+
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def async_import(config: dict) -> str:
+        async with semaphore:
+            try:
+                result = await hass.config_entries.flow.async_init(
+                    DOMAIN, context={"source": SOURCE_IMPORT}, data=config)
+            except Exception as e:
+                _LOGGER.exception("Unexpected error importing device %s.", config[CONF_ID])
+                return f"error: {e}"
+
+        if result["type"] == FlowResultType.CREATE_ENTRY:
+            return "added"
+        reason = result.get("reason")
+        return ABORT_REASONS.get(reason, reason)
+
+    outcomes = await asyncio.gather(*[async_import(config) for _, config in configs])
+    results += [(id, config[CONF_HOST], outcome) for (id, config), outcome in zip(configs, outcomes)]
+
+    _async_report(hass, results, time.monotonic() - start)
+    return results
+
+
+def _async_report(hass: HomeAssistant, results: list, duration: float) -> None:
+    added = sum(1 for *_, outcome in results if outcome == "added")
+    skipped = sum(1 for *_, outcome in results if outcome == "already configured")
+    failed = len(results) - added - skipped
+
+    _LOGGER.info("Imported %d of %d devices in %.1fs, %d already configured, %d failed.",
+                 added, len(results), duration, skipped, failed)
+
+    # Only bother the user when something changed or went wrong
+    if not added and not failed:
+        return
+
+    lines = [
+        f"Imported {added} of {len(results)} devices in {duration:.1f}s, "
+        f"{skipped} already configured, {failed} failed.",
+        "",
+        "| ID | Host | Result |",
+        "| :--- | :--- | :--- |",
+    ]
+    lines += [f"| {id} | {host} | {outcome} |" for id, host, outcome in results]
+
+    persistent_notification.async_create(
+        hass, "\n".join(lines), title="Midea AC device import",
+        notification_id=f"{DOMAIN}_import")
@@ -0,0 +1,365 @@
+"""Asyncio LAN transport for Midea Smart AC."""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+
+from msmart.const import MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_HANDSHAKE_REQUEST
+
+from . import codec
+from .metrics import MideaDeviceMetrics
+from .tracing import MideaTracer
+
+_LOGGER = logging.getLogger(__name__)
+
+# Timeouts in seconds
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 2
+
+# Devices need a moment after the handshake before accepting requests
+HANDSHAKE_DELAY = 1
+
+# Number of attempts for a request before giving up
+REQUEST_ATTEMPTS = 2
+
+
+
+class SessionRejected(Exception):
+    """The device rejected the V3 session key."""
+
+
+class MideaLan:
+    """Persistent asyncio connection to a Midea device speaking the V2 or V3 LAN protocol."""
+
+    def __init__(self, host: str, device_id: int, port: int = 6444, limiter=None,
+                 metrics: MideaDeviceMetrics | None = None, tracer: MideaTracer | None = None) -> None:
+        self._host = host
+        self._device_id = device_id
+        self._port = port
+
+        # Optional async context manager bounding requests across devices
+        self._limiter = limiter
+
+        # Traffic and failure counters, usually shared with the device
+        self._metrics = metrics or MideaDeviceMetrics()
+
+        # Spans of each request phase while tracing is enabled
+        self._tracer = tracer or MideaTracer()
+
+        self._reader = None
+        self._writer = None
+        self._buffer = b""
+
+        # Task reading from the connection, and the future of the request
+        # waiting for a response, or the raw reply during a handshake
+        self._read_task = None
+        self._waiter = None
+        self._handshaking = False
+
+        # Called with frames the device sent while no request was waiting
+        self._notify_callback = None
+
+        # V3 credentials and session of the current connection
+        self._token = None
+        self._key = None
+        self._session = None
+
+        # Serialize requests on the connection, this also ensures
+        # concurrent requests wait on a single in-flight handshake
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return 3 if self._token and self._key else 2
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def set_notify_callback(self, callback) -> None:
+        """Set a callback receiving frames the device sends on its own."""
+        self._notify_callback = callback
+
+    async def _connect(self) -> None:
+        if self.connected:
+            return
+
+        _LOGGER.debug("Connecting to %s:%d.", self._host, self._port)
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self._host, self._port), CONNECT_TIMEOUT)
+        self._buffer = b""
+        self._session = None
+        self._read_task = asyncio.get_running_loop().create_task(
+            self._read_loop(self._reader))
+
+    def _disconnect(self, exc: Exception | None = None) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+        if self._read_task is not None and self._read_task is not asyncio.current_task():
+            self._read_task.cancel()
+
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(exc or ConnectionResetError("Disconnected."))
+
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._buffer = b""
+        self._session = None
+
+    async def close(self) -> None:
+        """Close the connection to the device."""
+        async with self._lock:
+            writer = self._writer
+            self._disconnect()
+            if writer is not None:
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        """Read from the connection for as long as it is open."""
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    raise ConnectionResetError("Connection closed by device.")
+                self._metrics.bytes_received += len(data)
+                self._on_data(data)
+        except (OSError, ValueError, SessionRejected) as e:
+            _LOGGER.debug("Connection to %s:%d lost: %s",
+                          self._host, self._port, repr(e))
+            if reader is self._reader:
+                self._disconnect(e)
+        except Exception as e:
+            _LOGGER.exception("Unexpected error reading from %s:%d.",
+                              self._host, self._port)
+            # Fail the pending request as a lost connection rather than let it time out
+            if reader is self._reader:
+                self._disconnect(ConnectionResetError(repr(e)))
+
+    def _on_data(self, data: bytes) -> None:
+        waiter = self._waiter
+        if waiter is not None and waiter.done():
+            waiter = None
+
+        # The handshake reply is consumed as is
+        if self._handshaking:
+            if waiter is not None:
+                waiter.set_result(data)
+            return
+
+        self._buffer += data
+        if self.version == 3 and self._buffer[8:13] == b"ERROR":
+            self._buffer = b""
+            raise SessionRejected()
+
+        decode = self._decode_v3 if self.version == 3 else self._decode_v2
+        # Unwrap the packets from the V3 session or the V2 stream
+        with self._tracer.span("unwrap", self._device_id, protocol=self.version):
+            packets = decode()
+        if not packets:
+            return
+
+        # Decrypt the payloads of all packets at once
+        with self._tracer.span("decrypt", self._device_id, packets=len(packets)):
+            frames = [frame for frame in codec.decrypt_packets(packets)
+                      if len(frame) > codec.FRAME_HEADER_LENGTH]
+
+        if not frames:
+            return
+
+        if waiter is not None:
+            waiter.set_result(frames)
+        elif self._notify_callback is not None:
+            _LOGGER.debug("Got %d unsolicited frames from %s:%d.",
+                          len(frames), self._host, self._port)
+            try:
+                self._notify_callback(frames)
+            except Exception:
+                _LOGGER.exception("Error handling notification from %s:%d.",
+                                  self._host, self._port)
+
+    @contextlib.asynccontextmanager
+    async def _response(self, handshake: bool = False):
+        """Register a future the read loop completes with the response to a request."""
+        self._waiter = asyncio.get_running_loop().create_future()
+        self._handshaking = handshake
+        waiter = self._waiter
+        try:
+            yield waiter
+        finally:
+            self._waiter = None
+            self._handshaking = False
+
+            # Mark an error the caller never awaited as retrieved
+            if waiter.done() and not waiter.cancelled():
+                waiter.exception()
+
+    async def _write(self, data: bytes) -> None:
+        self._writer.write(data)
+        await self._writer.drain()
+        self._metrics.bytes_sent += len(data)
+
+    async def _handshake(self) -> bool:
+        start = time.monotonic()
+        success = False
+        session = codec.V3Session()
+        try:
+            request = session.encode(self._token, MSGTYPE_HANDSHAKE_REQUEST)
+            async with self._response(handshake=True) as response:
+                await self._write(request)
+                response = await asyncio.wait_for(response, READ_TIMEOUT)
+
+            success = session.handshake(response[8:72], self._key)
+        finally:
+            self._metrics.record("authenticate", time.monotonic() - start, success)
+
+        if not success:
+            _LOGGER.error("Authentication failed for %s:%d.",
+                          self._host, self._port)
+            self._metrics.auth_failures += 1
+            # The device won't talk on this connection any more, start over on the next request
+            self._disconnect()
+            return False
+
+        self._session = session
+        _LOGGER.debug("Got TCP key for %s:%d.", self._host, self._port)
+
+        await asyncio.sleep(HANDSHAKE_DELAY)
+        return True
+
+    def set_credentials(self, token: bytes, key: bytes) -> None:
+        """Set the V3 token and key. The handshake is deferred until the first request."""
+        if (token, key) != (self._token, self._key):
+            self._session = None
+        self._token, self._key = token, key
+
+    async def authenticate(self) -> bool:
+        """Perform the V3 handshake immediately."""
+        async with self._lock:
+            try:
+                await self._connect()
+                return await self._handshake()
+            except (OSError, asyncio.TimeoutError, SessionRejected) as e:
+                _LOGGER.error("Authentication error for %s:%d: %s",
+                              self._host, self._port, repr(e))
+                if isinstance(e, asyncio.TimeoutError):
+                    self._metrics.timeouts += 1
+                self._disconnect()
+                return False
+            except asyncio.CancelledError:
+                self._disconnect()
+                raise
+
+    async def connect(self) -> bool:
+        """Open the connection if necessary, so notifications from the device are received."""
+        async with contextlib.AsyncExitStack() as stack:
+            await stack.enter_async_context(self._lock)
+            if self.connected and (self.version == 2 or self._session is not None):
+                return True
+
+            # Dialling counts against the limit of the fleet like any other request
+            if self._limiter is not None:
+                await stack.enter_async_context(self._limiter)
+
+            try:
+                await self._connect()
+                if self.version == 3:
+                    return await self._handshake()
+                return True
+            except (OSError, asyncio.TimeoutError, SessionRejected) as e:
+                _LOGGER.debug("Failed to connect to %s:%d: %s",
+                              self._host, self._port, repr(e))
+                self._disconnect()
+                return False
+            except asyncio.CancelledError:
+                self._disconnect()
+                raise
+
+    def _decode_v2(self) -> list:
+        try:
+            packets, size = codec.split_packets(self._buffer)
+        except ValueError as e:
+            _LOGGER.error("Unknown response %s from %s:%d: %s",
+                          self._buffer.hex(), self._host, self._port, e)
+            self._buffer = b""
+            return []
+
+        # The views keep the old buffer alive until the packets are decrypted
+        self._buffer = self._buffer[size:]
+        return packets
+
+    def _decode_v3(self) -> list[bytes]:
+        if self._session is None:
+            raise ValueError("V3 packet without a session.")
+
+        packets, self._buffer = self._session.decode(self._buffer)
+        return packets
+
+    async def _request(self, data: bytes) -> list[bytes]:
+        span = self._tracer.span
+
+        if not self.connected:
+            with span("connect", self._device_id):
+                await self._connect()
+
+        if self.version == 3:
+            # Reuse the session key until the device rejects it
+            if self._session is None:
+                with span("handshake", self._device_id):
+                    if not await self._handshake():
+                        return []
+            with span("encrypt", self._device_id, protocol=3):
+                data = self._session.encode(data, MSGTYPE_ENCRYPTED_REQUEST)
+
+        # The read loop completes the response once at least one frame is received
+        async with self._response() as response:
+            with span("write", self._device_id, bytes=len(data)):
+                await self._write(data)
+
+            with span("wait", self._device_id):
+                return await asyncio.wait_for(response, READ_TIMEOUT)
+
+    async def send(self, data: bytes) -> list[bytes]:
+        """Send a packet to the device and return the decrypted response frames."""
+        async with contextlib.AsyncExitStack() as stack:
+            # Time spent waiting on other requests to this device and the fleet
+            with self._tracer.span("queue", self._device_id):
+                await stack.enter_async_context(self._lock)
+                if self._limiter is not None:
+                    await stack.enter_async_context(self._limiter)
+
+            return await self._send(data)
+
+    async def _send(self, data: bytes) -> list[bytes]:
+        responses = []
+        for attempt in range(REQUEST_ATTEMPTS):
+            try:
+                return await self._request(data)
+            except SessionRejected:
+                # Drop the session so the next attempt performs a new handshake
+                _LOGGER.debug("Session rejected by %s:%d (attempt %d).",
+                              self._host, self._port, attempt + 1)
+                self._disconnect()
+                self._metrics.auth_failures += 1
+                responses = [b"ERROR"]
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                _LOGGER.debug("Request to %s:%d failed (attempt %d): %s",
+                              self._host, self._port, attempt + 1, repr(e))
+                if isinstance(e, asyncio.TimeoutError):
+                    self._metrics.timeouts += 1
+                self._disconnect()
+                responses = []
+            except asyncio.CancelledError:
+                # Connection state is unknown after a cancelled request
+                self._disconnect()
+                raise
+
+        if responses:
+            _LOGGER.error("Got ERROR from %s:%d.", self._host, self._port)
+        return responses
@@ -0,0 +1,104 @@
+"""Performance metrics of Midea Smart AC devices."""
+from __future__ import annotations
+
+import datetime
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Operations measured on each device
+OPERATIONS = ("refresh", "apply", "capabilities", "authenticate")
+
+
+class MideaOperationMetrics:
+    """Latency histogram and outcome counters of a single kind of operation."""
+
+    def __init__(self) -> None:
+        self.successes = 0
+        self.failures = 0
+        self.last_latency = None
+        self.last_success = None
+
+        self._latency_sum = 0.0
+        self._buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, latency: float, success: bool) -> None:
+        if success:
+            self.successes += 1
+            self.last_success = datetime.datetime.now(datetime.timezone.utc)
+        else:
+            self.failures += 1
+
+        self.last_latency = latency
+        self._latency_sum += latency
+
+        # Last bucket holds latencies above the largest bound
+        bucket = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                bucket = i
+                break
+        self._buckets[bucket] += 1
+
+    @property
+    def count(self) -> int:
+        return self.successes + self.failures
+
+    @property
+    def mean_latency(self) -> float | None:
+        return self._latency_sum / self.count if self.count else None
+
+    @property
+    def histogram(self) -> dict:
+        """Number of operations per latency bucket, keyed by upper bound."""
+        bounds = [f"le_{b}" for b in LATENCY_BUCKETS] + ["le_inf"]
+        return dict(zip(bounds, self._buckets))
+
+    def as_dict(self) -> dict:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "last_latency": self.last_latency,
+            "mean_latency": self.mean_latency,
+            "last_success": self.last_success.isoformat() if self.last_success else None,
+            "histogram": self.histogram,
+        }
+
+
+class MideaDeviceMetrics:
+    """Metrics collected by the device and its LAN connection."""
+
+    def __init__(self) -> None:
+        self.operations = {op: MideaOperationMetrics() for op in OPERATIONS}
+
+        # Request attempts that timed out and V3 handshakes or sessions that failed
+        self.timeouts = 0
+        self.auth_failures = 0
+
+        # Failed requests hidden by the keep last known online state option
+        self.masked_failures = 0
+
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def record(self, operation: str, latency: float, success: bool) -> None:
+        self.operations[operation].record(latency, success)
+
+    @property
+    def failures(self) -> int:
+        return sum(op.failures for op in self.operations.values())
+
+    @property
+    def last_success(self) -> datetime.datetime | None:
+        times = [op.last_success for op in self.operations.values() if op.last_success]
+        return max(times) if times else None
+
+    def as_dict(self) -> dict:
+        return {
+            "operations": {name: op.as_dict() for name, op in self.operations.items()},
+            "timeouts": self.timeouts,
+            "auth_failures": self.auth_failures,
+            "masked_failures": self.masked_failures,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
@@ -4,16 +4,39 @@ from __future__ import annotations
 import logging
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import TEMP_CELSIUS, CONF_ID
-from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass, RestoreSensor
-from homeassistant.core import HomeAssistant
+from homeassistant.const import TEMP_CELSIUS, TIME_SECONDS, DATA_BYTES, CONF_ID
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass, SensorEntity, RestoreSensor
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 # Local constants
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_DEADBAND,
+    CONF_MIN_WRITE_INTERVAL,
+    DEFAULT_DEADBAND,
+    DEFAULT_MIN_WRITE_INTERVAL
+)
+from .coordinator import MideaDeviceUpdateCoordinator
+from .deadband import MideaDeadbandFilter
 
 _LOGGER = logging.getLogger(__name__)
 
+# Diagnostic metrics of each device as unit, device class and state class
+METRIC_SENSORS = {
+    "refresh_latency": (TIME_SECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT),
+    "apply_latency": (TIME_SECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT),
+    "failures": (None, None, SensorStateClass.TOTAL_INCREASING),
+    "timeouts": (None, None, SensorStateClass.TOTAL_INCREASING),
+    "auth_failures": (None, None, SensorStateClass.TOTAL_INCREASING),
+    "masked_failures": (None, None, SensorStateClass.TOTAL_INCREASING),
+    "last_success": (None, SensorDeviceClass.TIMESTAMP, None),
+    "bytes_sent": (DATA_BYTES, SensorDeviceClass.DATA_SIZE, SensorStateClass.TOTAL_INCREASING),
+    "bytes_received": (DATA_BYTES, SensorDeviceClass.DATA_SIZE, SensorStateClass.TOTAL_INCREASING),
+}
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -24,42 +47,61 @@ async def async_setup_entry(
 
     _LOGGER.info("Setting up sensor platform.")
 
-    # Get config data from entry
+    # Get config and options data from entry
     config = config_entry.data
+    options = config_entry.options
 
-    # Fetch device from global data
+    # Fetch coordinator from global data
     id = config.get(CONF_ID)
-    device = hass.data[DOMAIN][id]
+    coordinator = hass.data[DOMAIN].coordinators[id]
 
     # Create sensor entities from device
     add_entities([
-        MideaTemperatureSensor(device, "indoor_temperature"),
-        MideaTemperatureSensor(device, "outdoor_temperature"),
+        MideaTemperatureSensor(coordinator, "indoor_temperature", options),
+        MideaTemperatureSensor(coordinator, "outdoor_temperature", options),
+        MideaTemperatureTrendSensor(coordinator, "indoor_temperature", options),
+        MideaTemperatureTrendSensor(coordinator, "outdoor_temperature", options),
+    ] + [
+        MideaMetricSensor(coordinator, metric) for metric in METRIC_SENSORS
     ])
 
 
-class MideaTemperatureSensor(RestoreSensor):
+class MideaTemperatureSensor(CoordinatorEntity, RestoreSensor):
     """Temperature sensor for Midea AC."""
 
-    def __init__(self, device, prop):
-        self._device = device
+    def __init__(self, coordinator: MideaDeviceUpdateCoordinator, prop, options: dict):
+        super().__init__(coordinator)
+
+        self._device = coordinator.device
         self._prop = prop
         self._native_value = None
 
+        # Skip writing states that only jitter around the last written value
+        self._filter = MideaDeadbandFilter(
+            options.get(CONF_DEADBAND, DEFAULT_DEADBAND),
+            options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL))
+
     async def async_added_to_hass(self) -> None:
         await super().async_added_to_hass()
 
-        if (last_sensor_data := await self.async_get_last_sensor_data()) is None:
-            return
-
         # Restore previous native value
-        self._native_value = last_sensor_data.native_value
+        if (last_sensor_data := await self.async_get_last_sensor_data()) is not None:
+            self._native_value = last_sensor_data.native_value
+
+        # Grab the current value if the device has already been refreshed
+        self._update_native_value()
 
-    async def async_update(self) -> None:
+    def _update_native_value(self) -> None:
         # Grab the property from the device
         if self.available:
             self._native_value = getattr(self._device, self._prop)
 
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._update_native_value()
+        if self._filter.should_write(self._native_value, (self.available,)):
+            self.async_write_ha_state()
+
     @property
     def device_info(self) -> dict:
         return {
@@ -78,7 +120,7 @@ class MideaTemperatureSensor(RestoreSensor):
 
     @property
     def available(self) -> bool:
-        return self._device.online
+        return self.coordinator.last_update_success and self._device.online
 
     @property
     def device_class(self) -> str:
@@ -95,3 +137,128 @@ class MideaTemperatureSensor(RestoreSensor):
     @property
     def native_value(self) -> float:
         return self._native_value
+
+
+class MideaTemperatureTrendSensor(CoordinatorEntity, SensorEntity):
+    """Rate of change of a Midea AC temperature, with its rolling mean, minimum and maximum."""
+
+    # Trends are computed in memory, keep them out of the recorder
+    _unrecorded_attributes = frozenset({"mean", "min", "max"})
+
+    def __init__(self, coordinator: MideaDeviceUpdateCoordinator, prop, options: dict):
+        super().__init__(coordinator)
+
+        self._device = coordinator.device
+        self._prop = prop
+        self._history = coordinator.history[prop]
+
+        # Trends shift a little with every poll, so they are held back like temperatures
+        self._filter = MideaDeadbandFilter(
+            options.get(CONF_DEADBAND, DEFAULT_DEADBAND),
+            options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL))
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        stats = self._history.stats
+        if self._filter.should_write(stats["rate_of_change"],
+                                     (self.available, stats["mean"], stats["min"], stats["max"])):
+            self.async_write_ha_state()
+
+    @property
+    def device_info(self) -> dict:
+        return {
+            "identifiers": {
+                (DOMAIN, self._device.id)
+            },
+        }
+
+    @property
+    def name(self) -> str:
+        return f"{DOMAIN}_{self._prop}_trend_{self._device.id}"
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._device.id}-{self._prop}-trend"
+
+    @property
+    def available(self) -> bool:
+        return self.coordinator.last_update_success and self._device.online
+
+    @property
+    def state_class(self) -> str:
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def native_unit_of_measurement(self) -> str:
+        return f"{TEMP_CELSIUS}/h"
+
+    @property
+    def native_value(self) -> float | None:
+        return self._history.stats["rate_of_change"]
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        stats = self._history.stats
+        return {"mean": stats["mean"], "min": stats["min"], "max": stats["max"]}
+
+
+class MideaMetricSensor(CoordinatorEntity, SensorEntity):
+    """Diagnostic sensor reporting a performance metric of a Midea AC."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator: MideaDeviceUpdateCoordinator, metric):
+        super().__init__(coordinator)
+
+        self._device = coordinator.device
+        self._metric = metric
+
+        unit, device_class, state_class = METRIC_SENSORS[metric]
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+
+        # Latency sensors report the last operation of their kind
+        self._operation = metric[:-len("_latency")] if metric.endswith("_latency") else None
+
+    @property
+    def device_info(self) -> dict:
+        return {
+            "identifiers": {
+                (DOMAIN, self._device.id)
+            },
+        }
+
+    @property
+    def name(self) -> str:
+        return f"{DOMAIN}_{self._metric}_{self._device.id}"
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._device.id}-{self._metric}"
+
+    @property
+    def available(self) -> bool:
+        # Metrics are most useful while the device is failing
+        return True
+
+    @property
+    def native_value(self):
+        metrics = self._device.metrics
+        if self._operation is not None:
+            return metrics.operations[self._operation].last_latency
+        return getattr(metrics, self._metric)
+
+    @property
+    def extra_state_attributes(self) -> dict | None:
+        if self._operation is None:
+            return None
+
+        operation = self._device.metrics.operations[self._operation]
+        return {
+            "successes": operation.successes,
+            "failures": operation.failures,
+            "mean_latency": operation.mean_latency,
+            **operation.histogram,
+        }
@@ -0,0 +1,287 @@
+"""Services of the Midea Smart AC integration."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+
+from homeassistant.components.climate import DOMAIN as CLIMATE_DOMAIN
+from homeassistant.components.climate.const import (
+    ATTR_FAN_MODE, ATTR_HVAC_MODE, ATTR_PRESET_MODE, ATTR_SWING_MODE,
+    PRESET_NONE, PRESET_ECO, PRESET_BOOST)
+from homeassistant.const import (
+    ATTR_AREA_ID, ATTR_DEVICE_ID, ATTR_ENTITY_ID, ATTR_TEMPERATURE, ENTITY_MATCH_ALL)
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers import entity_registry
+from homeassistant.helpers.service import async_extract_referenced_entity_ids
+import homeassistant.util.dt as dt_util
+from msmart.device import air_conditioning as ac
+import voluptuous as vol
+
+# Local constants
+from .climate import set_device_state
+from .const import (
+    DOMAIN,
+    SERVICE_START_TRACE,
+    SERVICE_STOP_TRACE,
+    SERVICE_GROUP_APPLY,
+    SERVICE_SNAPSHOT,
+    SERVICE_RESTORE,
+    ATTR_MAX_SPANS,
+    ATTR_FILENAME,
+    ATTR_MAX_PARALLEL,
+    ATTR_RETRIES,
+    ATTR_SNAPSHOT
+)
+from .coordinator import MideaDeviceUpdateCoordinator
+from .fleet import MideaFleet
+from .snapshot import async_get_snapshot_store
+from .tracing import DEFAULT_MAX_SPANS, write_chrome_trace
+
+_LOGGER = logging.getLogger(__name__)
+
+START_TRACE_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_MAX_SPANS, default=DEFAULT_MAX_SPANS): vol.All(vol.Coerce(int), vol.Range(min=1)),
+})
+
+STOP_TRACE_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_FILENAME): cv.string,
+})
+
+# Settings of the target state, named like the climate entity attributes
+GROUP_SETTINGS = (ATTR_HVAC_MODE, ATTR_TEMPERATURE, ATTR_FAN_MODE, ATTR_SWING_MODE, ATTR_PRESET_MODE)
+
+# Devices applied to at once by default
+DEFAULT_MAX_PARALLEL = 32
+
+# Delay in seconds before retrying a device, doubled for each further retry
+RETRY_DELAY = 0.5
+
+GROUP_APPLY_SCHEMA = vol.All(
+    cv.make_entity_service_schema({
+        vol.Optional(ATTR_HVAC_MODE): vol.In(ac.operational_mode_enum.list() + ["off"]),
+        vol.Optional(ATTR_TEMPERATURE): vol.All(vol.Coerce(float), vol.Range(min=17, max=30)),
+        vol.Optional(ATTR_FAN_MODE): vol.All(cv.string, vol.Lower, vol.In([m.lower() for m in ac.fan_speed_enum.list()])),
+        vol.Optional(ATTR_SWING_MODE): vol.In(ac.swing_mode_enum.list()),
+        vol.Optional(ATTR_PRESET_MODE): vol.In([PRESET_NONE, PRESET_ECO, PRESET_BOOST]),
+        vol.Optional(ATTR_MAX_PARALLEL, default=DEFAULT_MAX_PARALLEL): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(ATTR_RETRIES, default=2): vol.All(vol.Coerce(int), vol.Range(min=0, max=5)),
+    }),
+    cv.has_at_least_one_key(*GROUP_SETTINGS),
+)
+
+# Snapshot used when none is named
+DEFAULT_SNAPSHOT = "default"
+
+# Without a target these act on every device
+SNAPSHOT_SCHEMA = vol.Schema({
+    **cv.ENTITY_SERVICE_FIELDS,
+    vol.Optional(ATTR_SNAPSHOT, default=DEFAULT_SNAPSHOT): cv.string,
+})
+
+RESTORE_SCHEMA = vol.Schema({
+    **cv.ENTITY_SERVICE_FIELDS,
+    vol.Optional(ATTR_SNAPSHOT, default=DEFAULT_SNAPSHOT): cv.string,
+    vol.Optional(ATTR_MAX_PARALLEL, default=DEFAULT_MAX_PARALLEL): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(ATTR_RETRIES, default=2): vol.All(vol.Coerce(int), vol.Range(min=0, max=5)),
+})
+
+
+@callback
+def _async_get_coordinators(hass: HomeAssistant, fleet: MideaFleet, call: ServiceCall,
+                            default_all: bool = False) -> dict:
+    """Map the climate entities targeted by a service call to their coordinators.
+
+    With default_all, a call without a target selects every device.
+    """
+    registry = entity_registry.async_get(hass)
+    targeted = any(key in call.data for key in (ATTR_ENTITY_ID, ATTR_DEVICE_ID, ATTR_AREA_ID))
+
+    if call.data.get(ATTR_ENTITY_ID) == ENTITY_MATCH_ALL or (default_all and not targeted):
+        entity_ids = {entry.entity_id for entry in registry.entities.values() if entry.platform == DOMAIN}
+    else:
+        selected = async_extract_referenced_entity_ids(hass, call)
+        entity_ids = selected.referenced | selected.indirectly_referenced
+
+    coordinators = {}
+    for entity_id in sorted(entity_ids):
+        entry = registry.async_get(entity_id)
+        if entry is None or entry.platform != DOMAIN or entry.domain != CLIMATE_DOMAIN:
+            continue
+        if (coordinator := fleet.coordinators.get(entry.unique_id)) is not None:
+            coordinators[entity_id] = coordinator
+    return coordinators
+
+
+async def _async_apply_change(coordinator: MideaDeviceUpdateCoordinator, change, retries: int) -> dict:
+    """Make a change to the local state of a device and apply it, retrying on failure.
+
+    The change is made again before each attempt since polls between attempts
+    may have replaced the local state. A device that still fails gets back its
+    previous local state. Returns the outcome for a service response.
+    """
+    device = coordinator.device
+    previous = device.state
+    attempts = 0
+    error = None
+
+    start = time.monotonic()
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+        change(device)
+        attempts += 1
+        if await coordinator.async_apply():
+            break
+
+        # Don't retry devices that are known to be unreachable
+        if coordinator.breaker.is_open:
+            error = "unreachable"
+            break
+    else:
+        error = "not confirmed"
+    duration = time.monotonic() - start
+
+    # Confirmed changes were already pushed to the entities by the coordinator
+    if error is not None:
+        device.restore_state(previous)
+        coordinator.async_update_listeners()
+
+    return {
+        "device_id": device.id,
+        "success": error is None,
+        "attempts": attempts,
+        "duration": round(duration, 3),
+        "error": error,
+    }
+
+
+@callback
+def async_setup_services(hass: HomeAssistant, fleet: MideaFleet) -> None:
+    """Register the services shared by all devices."""
+
+    async def async_start_trace(call: ServiceCall) -> None:
+        fleet.tracer.start(call.data[ATTR_MAX_SPANS])
+        _LOGGER.info("Tracing requests to Midea devices.")
+
+    async def async_stop_trace(call: ServiceCall) -> None:
+        if not fleet.tracer.enabled:
+            _LOGGER.warning("Tracing is not running.")
+            return
+
+        spans = fleet.tracer.stop()
+
+        # Traces are always written to the config directory
+        filename = call.data.get(ATTR_FILENAME) or f"{DOMAIN}_trace_{dt_util.now():%Y%m%d_%H%M%S}.json"
+        path = hass.config.path(DOMAIN, os.path.basename(filename))
+
+        await hass.async_add_executor_job(write_chrome_trace, path, spans)
+        _LOGGER.info("Wrote %d spans to %s.", len(spans), path)
+
+    async def async_group_apply(call: ServiceCall) -> ServiceResponse:
+        coordinators = _async_get_coordinators(hass, fleet, call)
+        settings = {key: call.data[key] for key in GROUP_SETTINGS if key in call.data}
+        retries = call.data[ATTR_RETRIES]
+        semaphore = asyncio.Semaphore(call.data[ATTR_MAX_PARALLEL])
+
+        async def async_apply(coordinator: MideaDeviceUpdateCoordinator) -> dict:
+            include_off_as_state = coordinator.include_off_as_state
+
+            # Like their entities, devices without an off mode are only powered off by turn_off
+            if settings.get(ATTR_HVAC_MODE) == "off" and not include_off_as_state:
+                return {"device_id": coordinator.device.id, "success": False, "attempts": 0,
+                        "duration": 0.0, "error": "off is not an HVAC mode"}
+
+            async with semaphore:
+                return await _async_apply_change(
+                    coordinator,
+                    lambda device: set_device_state(device, include_off_as_state, **settings),
+                    retries)
+
+        start = time.monotonic()
+        results = await asyncio.gather(*[async_apply(c) for c in coordinators.values()])
+        duration = time.monotonic() - start
+
+        failed = sum(1 for result in results if not result["success"])
+        _LOGGER.info("Applied %s to %d devices in %.2fs, %d failed.",
+                     settings, len(results), duration, failed)
+
+        return {
+            "duration": round(duration, 3),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": dict(zip(coordinators, results)),
+        }
+
+    async def async_snapshot(call: ServiceCall) -> ServiceResponse:
+        coordinators = _async_get_coordinators(hass, fleet, call, default_all=True)
+        name = call.data[ATTR_SNAPSHOT]
+
+        store = await async_get_snapshot_store(hass)
+        await store.async_save(name, {c.device.id: c.device.state for c in coordinators.values()})
+        _LOGGER.info("Saved the state of %d devices to snapshot '%s'.", len(coordinators), name)
+
+        return {"devices": len(coordinators)}
+
+    async def async_restore(call: ServiceCall) -> ServiceResponse:
+        name = call.data[ATTR_SNAPSHOT]
+        store = await async_get_snapshot_store(hass)
+        if (states := store.get(name)) is None:
+            raise HomeAssistantError(f"Snapshot '{name}' does not exist.")
+
+        coordinators = {
+            entity_id: coordinator
+            for entity_id, coordinator in _async_get_coordinators(hass, fleet, call, default_all=True).items()
+            if str(coordinator.device.id) in states
+        }
+        retries = call.data[ATTR_RETRIES]
+        semaphore = asyncio.Semaphore(call.data[ATTR_MAX_PARALLEL])
+
+        async def async_restore_device(coordinator: MideaDeviceUpdateCoordinator) -> dict:
+            state = states[str(coordinator.device.id)]
+
+            # Devices last seen in the saved state are left alone
+            if coordinator.last_update_success and coordinator.device.state == state:
+                return {"device_id": coordinator.device.id, "success": True, "attempts": 0,
+                        "duration": 0.0, "error": None, "skipped": True}
+
+            # The whole state is written back with a single apply
+            async with semaphore:
+                result = await _async_apply_change(
+                    coordinator, lambda device: device.restore_state(state), retries)
+            return {**result, "skipped": False}
+
+        start = time.monotonic()
+        results = await asyncio.gather(*[async_restore_device(c) for c in coordinators.values()])
+        duration = time.monotonic() - start
+
+        skipped = sum(1 for result in results if result["skipped"])
+        failed = sum(1 for result in results if not result["success"])
+        _LOGGER.info("Restored snapshot '%s' to %d devices in %.2fs, %d already in that state, %d failed.",
+                     name, len(results), duration, skipped, failed)
+
+        return {
+            "duration": round(duration, 3),
+            "succeeded": len(results) - skipped - failed,
+            "skipped": skipped,
+            "failed": failed,
+            "results": dict(zip(coordinators, results)),
+        }
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_START_TRACE, async_start_trace, schema=START_TRACE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_STOP_TRACE, async_stop_trace, schema=STOP_TRACE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_GROUP_APPLY, async_group_apply, schema=GROUP_APPLY_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(
+        DOMAIN, SERVICE_SNAPSHOT, async_snapshot, schema=SNAPSHOT_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(
+        DOMAIN, SERVICE_RESTORE, async_restore, schema=RESTORE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL)
@@ -0,0 +1,76 @@
+"""Persistent snapshots of the state of Midea Smart AC devices."""
+from __future__ import annotations
+
+import time
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from msmart.device import air_conditioning as ac
+
+# Local constants
+from .const import DOMAIN
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.snapshots"
+
+DATA_SNAPSHOT_STORE = f"{DOMAIN}_snapshot_store"
+
+# State properties stored by enum member name
+STATE_ENUMS = {
+    "operational_mode": ac.operational_mode_enum,
+    "fan_speed": ac.fan_speed_enum,
+    "swing_mode": ac.swing_mode_enum,
+}
+
+
+def serialize_state(state: dict) -> dict:
+    """Convert a device state to JSON compatible values."""
+    return {
+        key: value.name if key in STATE_ENUMS and value is not None else value
+        for key, value in state.items()
+    }
+
+
+def deserialize_state(data: dict) -> dict:
+    """Convert a stored state back to the values of the device state property."""
+    return {
+        key: STATE_ENUMS[key][value] if key in STATE_ENUMS and value is not None else value
+        for key, value in data.items()
+    }
+
+
+class MideaSnapshotStore:
+    """Named snapshots of device states stored by appliance ID."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._data = None
+
+    async def async_load(self) -> None:
+        if self._data is None:
+            self._data = await self._store.async_load() or {}
+
+    def get(self, name: str) -> dict | None:
+        """Return the states of a snapshot by appliance ID."""
+        if (snapshot := self._data.get(name)) is None:
+            return None
+        return {id: deserialize_state(state) for id, state in snapshot["devices"].items()}
+
+    async def async_save(self, name: str, states: dict) -> None:
+        """Replace a snapshot with the states of the devices by appliance ID."""
+        self._data[name] = {
+            "devices": {str(id): serialize_state(state) for id, state in states.items()},
+            "timestamp": time.time(),
+        }
+        # Snapshots are taken before disruptions, so save right away
+        await self._store.async_save(self._data)
+
+
+async def async_get_snapshot_store(hass: HomeAssistant) -> MideaSnapshotStore:
+    """Return the shared snapshot store, loading it if necessary."""
+    if (store := hass.data.get(DATA_SNAPSHOT_STORE)) is None:
+        store = MideaSnapshotStore(hass)
+        hass.data[DATA_SNAPSHOT_STORE] = store
+
+    await store.async_load()
+    return store
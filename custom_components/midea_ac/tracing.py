@@ -0,0 +1,100 @@
+"""Opt-in request tracing for Midea Smart AC."""
+from __future__ import annotations
+
+from collections import deque
+import contextlib
+import json
+import os
+import time
+
+# Default number of spans kept while tracing
+DEFAULT_MAX_SPANS = 10000
+
+# Returned while tracing is disabled, nullcontext can be reused
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    """Record the duration of a phase when its context exits."""
+
+    __slots__ = ("_tracer", "_name", "_device_id", "_args", "_start")
+
+    def __init__(self, tracer: MideaTracer, name: str, device_id: int, args: dict) -> None:
+        self._tracer = tracer
+        self._name = name
+        self._device_id = device_id
+        self._args = args
+
+    def __enter__(self) -> _Span:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self._args["error"] = exc_type.__name__
+        self._tracer._record(self._name, self._device_id, self._start, duration, self._args)
+
+
+class MideaTracer:
+    """Keep spans of device requests in a bounded ring buffer."""
+
+    def __init__(self) -> None:
+        self._spans = None
+        self._origin = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._spans is not None
+
+    def start(self, max_spans: int = DEFAULT_MAX_SPANS) -> None:
+        """Start tracing, discarding spans of any previous trace."""
+        self._spans = deque(maxlen=max_spans)
+        self._origin = time.perf_counter()
+
+    def stop(self) -> list:
+        """Stop tracing and return the recorded spans."""
+        spans, self._spans = self._spans, None
+        return list(spans or [])
+
+    def span(self, name: str, device_id: int, **args):
+        """Context manager timing a phase of a request made to a device."""
+        if self._spans is None:
+            return _NULL_SPAN
+        return _Span(self, name, device_id, args)
+
+    def _record(self, name: str, device_id: int, start: float, duration: float, args: dict) -> None:
+        # Tracing may have stopped while the span was open
+        if self._spans is not None:
+            self._spans.append((name, device_id, start - self._origin, duration, args))
+
+
+def chrome_trace(spans: list) -> dict:
+    """Convert spans to the Chrome trace event format, one thread per device."""
+    events = []
+    for device_id in sorted({span[1] for span in spans}):
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": 1, "tid": device_id,
+            "args": {"name": f"Device {device_id}"},
+        })
+
+    for name, device_id, start, duration, args in spans:
+        events.append({
+            "name": name,
+            "cat": "midea_ac",
+            "ph": "X",
+            "pid": 1,
+            "tid": device_id,
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "args": args,
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome_trace(path: str, spans: list) -> None:
+    """Write spans to a Chrome trace file, run in the executor."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(chrome_trace(spans), f)
@@ -1,19 +1,90 @@
 #!/usr/bin/env python3
 import sys
 import argparse
-import json
-import pprint
+import collections
+import datetime
+import functools
+import heapq
+import importlib.util
 import ipaddress
-import pyshark
-from msmart.lan import lan
-from msmart.command import appliance_response
-from msmart.security import security
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import zlib
+from msmart.const import (
+    MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_ENCRYPTED_RESPONSE, MSGTYPE_HANDSHAKE_REQUEST, MSGTYPE_HANDSHAKE_RESPONSE)
+
+
+def load_codec():
+    """Load the protocol codec of the integration without importing Home Assistant."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "custom_components", "midea_ac", "codec.py")
+    spec = importlib.util.spec_from_file_location("midea_ac_codec", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+codec = load_codec()
+
+# pcap magic numbers in file byte order
+PCAP_MAGIC_USEC = b"\xd4\xc3\xb2\xa1"
+PCAP_MAGIC_USEC_BE = b"\xa1\xb2\xc3\xd4"
+PCAP_MAGIC_NSEC = b"\x4d\x3c\xb2\xa1"
+PCAP_MAGIC_NSEC_BE = b"\xa1\xb2\x3c\x4d"
+
+# pcapng block types
+PCAPNG_SECTION_HEADER = b"\x0a\x0d\x0d\x0a"
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_PACKET = 0x00000002
+PCAPNG_SIMPLE_PACKET = 0x00000003
+PCAPNG_ENHANCED_PACKET = 0x00000006
+
+# pcapng interface option with the timestamp resolution
+PCAPNG_OPTION_TSRESOL = 9
+
+# Link layer types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+IPPROTO_TCP = 6
+TCP_HEADER = struct.Struct(">HHIxxxxBB")
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+
+# Out of order segments held per TCP stream before giving up on a gap
+MAX_PENDING_SEGMENTS = 64
+
+# TCP streams tracked at once, the least recently active are dropped first
+MAX_STREAMS = 4096
+
+# Records per batch and batches queued per worker process
+SHARD_BATCH_RECORDS = 1000
+SHARD_QUEUE_BATCHES = 16
+
+# Number of records per block of indexed output
+INDEX_BLOCK_RECORDS = 10000
+
+# Suffix of the index written next to jsonl and parquet output
+INDEX_SUFFIX = ".idx"
 
 
 def convert_device_id_int(device_id: str):
-    old = bytearray.fromhex(device_id)
-    new = reversed(old)
-    return int(bytearray(new).hex(), 16)
+    return int.from_bytes(bytes.fromhex(device_id), 'little')
 
 
 def get_type(i: int):
@@ -59,70 +130,883 @@ def get_fan_speed(i: int):
         return 'unknown'
 
 
-parser = argparse.ArgumentParser(
-    description=(
-        "Decipher Midea's Msmart local binary protocol from "
-        "Wireshark / pcap-ng captures"))
-parser.add_argument("pcapfile", type=str, help="path to pcapng dump")
-
-parser.add_argument('-f', "--fiter_type", type=str, dest="fiter_type", help='fliter type from midea message',
-                    default='all', choices=['all', 'get', 'reply', 'set', 'unknown', 'error'])
-parser.add_argument("--tcp-raw", action='store_true')
-parser.add_argument("--msg-raw", action='store_true')
-args = parser.parse_args()
-cap = pyshark.FileCapture(
-    args.pcapfile, display_filter=("tcp && data.len == 104 && data[:2] == 5a5a"))
-
-_security = security()
-
-for packet in cap:
-    packet.data.raw_mode = True
-    tcp_data = packet.data.data
-    tcp_data_bytes = bytearray.fromhex(tcp_data)
-    tcp_data_len = int(tcp_data_bytes[4:5].hex(), 16)
-    if len(tcp_data_bytes) != tcp_data_len:
-        continue
-    device_id = tcp_data_bytes[20:26].hex()
-    midea_data = tcp_data_bytes[40:88]
-    reply = _security.aes_decrypt(midea_data)
-
-    msg_type_hex = 255
-    msg_type = 'error'
-
-    if len(reply) >= 20:
-        msg_type_hex = reply[1]
-        msg_type = get_type(msg_type_hex)
-
-    if args.fiter_type != 'all':
-        if msg_type != args.fiter_type:
-            continue
+class Capture:
+    """Streaming reader of pcap and pcapng files.
+
+    The file is memory mapped and packets are yielded as memoryview slices of
+    the map, so memory use stays constant regardless of the capture size.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic = self._map[:4]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self.format, self._endian = "pcap", "<"
+        elif magic in (PCAP_MAGIC_USEC_BE, PCAP_MAGIC_NSEC_BE):
+            self.format, self._endian = "pcap", ">"
+        elif magic == PCAPNG_SECTION_HEADER:
+            self.format, self._endian = "pcapng", "<"
+        else:
+            raise ValueError("Not a pcap or pcapng file")
+
+        if self.format == "pcap":
+            scale = 1e-9 if magic in (PCAP_MAGIC_NSEC, PCAP_MAGIC_NSEC_BE) else 1e-6
+            linktype, = struct.unpack_from(self._endian + "I", self._map, 20)
+            self._start = 24
+            self._interfaces = ((linktype & 0xFFFF, scale),)
+        else:
+            self._start = 0
+            self._interfaces = ()
+
+    def close(self):
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            # Packets are still referenced, the map is freed once they are collected
+            pass
+        self._file.close()
+
+    def packets(self):
+        """Yield (number, timestamp, linktype, data) of each packet in the capture."""
+        if self.format == "pcap":
+            yield from self._pcap_packets()
+        else:
+            yield from self._pcapng_packets()
+
+    def _pcap_packets(self):
+        header = struct.Struct(self._endian + "IIII")
+        view = self._view
+        linktype, scale = self._interfaces[0]
+
+        offset, end, number = self._start, len(view), 1
+
+        while offset + 16 <= end:
+            seconds, fraction, length, _ = header.unpack_from(view, offset)
+            offset += 16
+            if offset + length > end:
+                break
+            yield number, seconds + fraction * scale, linktype, view[offset:offset + length]
+            offset += length
+            number += 1
+
+    def _pcapng_packets(self):
+        view = self._view
+        data = self._map
+        endian = self._endian
+        interfaces = self._interfaces
+        offset, end, number = self._start, len(view), 1
+
+        header = struct.Struct(endian + "II")
+        enhanced = struct.Struct(endian + "IIIII")
+        obsolete = struct.Struct(endian + "HHIII")
+        simple = struct.Struct(endian + "I")
+
+        while offset + 12 <= end:
+            if data[offset:offset + 4] == PCAPNG_SECTION_HEADER:
+                endian = "<" if data[offset + 8:offset + 12] == b"\x4d\x3c\x2b\x1a" else ">"
+                header = struct.Struct(endian + "II")
+                enhanced = struct.Struct(endian + "IIIII")
+                obsolete = struct.Struct(endian + "HHIII")
+                simple = struct.Struct(endian + "I")
+                interfaces = ()
+
+            block_type, length = header.unpack_from(view, offset)
+            if length < 12 or offset + length > end:
+                break
+
+            if block_type == PCAPNG_ENHANCED_PACKET:
+                interface, high, low, captured, _ = enhanced.unpack_from(view, offset + 8)
+                linktype, scale = interfaces[interface]
+                body = offset + 28
+                yield number, ((high << 32) | low) * scale, linktype, view[body:body + captured]
+                number += 1
+            elif block_type == PCAPNG_SIMPLE_PACKET:
+                original, = simple.unpack_from(view, offset + 8)
+                linktype, _ = interfaces[0]
+                body = offset + 12
+                yield number, None, linktype, view[body:body + min(original, length - 16)]
+                number += 1
+            elif block_type == PCAPNG_PACKET:
+                interface, _, high, low, captured = obsolete.unpack_from(view, offset + 8)
+                linktype, scale = interfaces[interface]
+                body = offset + 28
+                yield number, ((high << 32) | low) * scale, linktype, view[body:body + captured]
+                number += 1
+            elif block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                interfaces += (self._interface(offset, length, endian),)
+
+            offset += length
+
+    def _interface(self, offset: int, length: int, endian: str) -> tuple:
+        """Parse the link type and timestamp scale of an interface description block."""
+        data = self._map
+        linktype, = struct.unpack_from(endian + "H", data, offset + 8)
+        scale = 1e-6
+
+        option = offset + 16
+        end = offset + length - 4
+        while option + 4 <= end:
+            code, size = struct.unpack_from(endian + "HH", data, option)
+            if code == 0:
+                break
+            if code == PCAPNG_OPTION_TSRESOL and size >= 1:
+                resolution = data[option + 4]
+                if resolution & 0x80:
+                    scale = 2.0 ** -(resolution & 0x7F)
+                else:
+                    scale = 10.0 ** -resolution
+            option += 4 + ((size + 3) & ~3)
+
+        return linktype, scale
+
+
+@functools.lru_cache(maxsize=None)
+def ip_address(raw: bytes):
+    # Captures hold few distinct addresses, parse each only once
+    return ipaddress.ip_address(raw)
+
+
+def tcp_payload(linktype: int, data: memoryview):
+    """Return (src, dst, sport, dport, seq, flags, payload) of a TCP packet, or None for anything else."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        offset = 12
+        ethertype = (data[offset] << 8) | data[offset + 1]
+        while ethertype in ETHERTYPE_VLAN and len(data) >= offset + 6:
+            offset += 4
+            ethertype = (data[offset] << 8) | data[offset + 1]
+        offset += 2
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16:
+            return None
+        ethertype = (data[14] << 8) | data[15]
+        offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20:
+            return None
+        ethertype = (data[0] << 8) | data[1]
+        offset = 20
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_NULL, LINKTYPE_LOOP):
+        offset = 4 if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP) else 0
+        if len(data) <= offset:
+            return None
+        version = data[offset] >> 4
+        ethertype = ETHERTYPE_IPV4 if version == 4 else ETHERTYPE_IPV6 if version == 6 else None
+    else:
+        return None
+
+    if ethertype == ETHERTYPE_IPV4:
+        if len(data) < offset + 20:
+            return None
+        header_length = (data[offset] & 0x0F) * 4
+        total_length = (data[offset + 2] << 8) | data[offset + 3]
+        fragment = ((data[offset + 6] & 0x1F) << 8) | data[offset + 7]
+        if data[offset + 9] != IPPROTO_TCP or fragment:
+            return None
+        src = data[offset + 12:offset + 16]
+        dst = data[offset + 16:offset + 20]
+        # Total length excludes any link layer padding, zero with segmentation offload
+        end = offset + total_length if total_length else len(data)
+        offset += header_length
+    elif ethertype == ETHERTYPE_IPV6:
+        if len(data) < offset + 40:
+            return None
+        next_header = data[offset + 6]
+        payload_length = (data[offset + 4] << 8) | data[offset + 5]
+        src = data[offset + 8:offset + 24]
+        dst = data[offset + 24:offset + 40]
+        end = offset + 40 + payload_length
+        offset += 40
+        while next_header in IPV6_EXTENSION_HEADERS and len(data) >= offset + 2:
+            next_header = data[offset]
+            offset += (data[offset + 1] + 1) * 8
+        if next_header != IPPROTO_TCP:
+            return None
+    else:
+        return None
+
+    if len(data) < offset + 20:
+        return None
+    sport, dport, seq, data_offset, flags = TCP_HEADER.unpack_from(data, offset)
+    data_offset = (data_offset >> 4) * 4
+    return src, dst, sport, dport, seq, flags, data[offset + data_offset:end]
+
+
+def peek_type(cipher, data: bytes) -> str:
+    """Predict the message type by decrypting only the first block.
+
+    ECB blocks decrypt independently, so filters can drop most packets without
+    decrypting them in full. Messages that turn out truncated are errors instead.
+    """
+    if len(data) < 32:
+        return 'error'
+    return get_type(cipher.decrypt(data[:16])[1])
+
+
+def seq_offset(seq: int, base: int) -> int:
+    """Signed distance between two TCP sequence numbers."""
+    return ((seq - base + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+class TcpStream:
+    """Reassemble one direction of a TCP connection into Midea messages."""
+
+    def __init__(self):
+        self.next_seq = None
+        self.buffer = bytearray()
+        self.pending = {}
+
+    def feed(self, seq: int, flags: int, payload: memoryview) -> None:
+        if flags & TCP_SYN:
+            self.next_seq = (seq + 1) & 0xFFFFFFFF
+            self.buffer.clear()
+            self.pending.clear()
+            return
+
+        if not payload:
+            return
+
+        # Connections already open when the capture started begin at their first segment
+        if self.next_seq is None:
+            self.next_seq = seq
+
+        offset = seq_offset(seq, self.next_seq)
+        if offset > 0:
+            # Out of order, hold on to it until the gap is filled
+            self.pending[seq] = bytes(payload)
+            if len(self.pending) > MAX_PENDING_SEGMENTS:
+                # The gap was never captured, skip it along with the partial message
+                self.buffer.clear()
+                self.next_seq = min(self.pending, key=lambda s: seq_offset(s, self.next_seq))
+                self._drain()
+            return
+
+        self._append(payload, -offset)
+        self._drain()
+
+    def _append(self, payload, skip: int) -> None:
+        # Retransmitted bytes are already in the buffer
+        if skip < len(payload):
+            self.buffer += payload[skip:]
+            self.next_seq = (self.next_seq + len(payload) - skip) & 0xFFFFFFFF
+
+    def _drain(self) -> None:
+        while self.pending:
+            for seq in self.pending:
+                offset = seq_offset(seq, self.next_seq)
+                if offset <= 0:
+                    break
+            else:
+                return
+            self._append(self.pending.pop(seq), -offset)
+
+    def messages(self):
+        """Yield the complete 0x5A5A and 0x8370 messages in the buffer."""
+        buffer = self.buffer
+        while len(buffer) >= 6:
+            if buffer[0] == 0x5A and buffer[1] == 0x5A:
+                size = buffer[4] | (buffer[5] << 8)
+            elif buffer[0] == 0x83 and buffer[1] == 0x70:
+                size = ((buffer[2] << 8) | buffer[3]) + 8
+            else:
+                size = 0
+
+            if size < 6:
+                # Not at a message boundary, skip ahead to the next one
+                starts = [i for i in (buffer.find(b"\x5a\x5a", 1), buffer.find(b"\x83\x70", 1)) if i > 0]
+                del buffer[:min(starts) if starts else len(buffer) - 1]
+                continue
+
+            if len(buffer) < size:
+                break
+
+            message = bytes(buffer[:size])
+            del buffer[:size]
+            yield message
+
+
+class Session:
+    """V3 session of a TCP connection, usable once its handshake was seen."""
+
+    def __init__(self):
+        self.codec = codec.V3Session()
+        self.key = None
+        self.device = None
+        self.established = False
+
+
+class Decoder:
+    """Decrypt and decode the Midea messages among a stream of packets.
+
+    With several shards, each decoder only handles the connections hashed to
+    its shard, so every connection is reassembled by exactly one process.
+    """
+
+    def __init__(self, options, shard: int = 0, shards: int = 1):
+        self._options = options
+        self._shard = shard
+        self._shards = shards
+
+        self._cipher = codec.ecb_cipher()
+
+        self._streams = collections.OrderedDict()
+        self._sessions = {}
+
+    def feed(self, number, timestamp, linktype, data):
+        result = tcp_payload(linktype, data)
+        if result is None:
+            return
+        src, dst, sport, dport, seq, flags, payload = result
+        src, dst = bytes(src), bytes(dst)
+
+        # Both directions of a connection share its V3 session
+        if (src, sport) < (dst, dport):
+            connection = (src, sport, dst, dport)
+        else:
+            connection = (dst, dport, src, sport)
+
+        if self._shards > 1 and zlib.crc32(repr(connection).encode()) % self._shards != self._shard:
+            return
+
+        direction = (src, sport, dst, dport)
+        stream = self._streams.get(direction)
+        if stream is None:
+            # Ignore bare ACKs of connections without Midea traffic
+            if not payload and not flags & TCP_SYN:
+                return
+            stream = self._streams[direction] = TcpStream()
+            if len(self._streams) > MAX_STREAMS:
+                self._streams.popitem(last=False)
+        else:
+            self._streams.move_to_end(direction)
+
+        stream.feed(seq, flags, payload)
+        for message in stream.messages():
+            yield from self._decode_message(number, timestamp, src, dst, connection, message)
+
+        if flags & (TCP_FIN | TCP_RST):
+            self._streams.pop(direction, None)
+            reverse = (dst, dport, src, sport)
+            if flags & TCP_RST:
+                self._streams.pop(reverse, None)
+            if reverse not in self._streams:
+                self._sessions.pop(connection, None)
+
+    def _decode_message(self, number, timestamp, src, dst, connection, message):
+        options = self._options
+
+        # Filter on time before decryption, but after reassembly so no handshake is missed
+        in_range = timestamp is None or not (
+            (options.since is not None and timestamp < options.since)
+            or (options.until is not None and timestamp > options.until))
+
+        if message[:2] == codec.V2_MAGIC:
+            if in_range:
+                yield from self._decode_packets(number, timestamp, src, dst, [message], message, 2)
+            return
+
+        session = self._sessions.get(connection)
+        if session is None:
+            session = self._sessions[connection] = Session()
+
+        msgtype = message[5] & 0xF
+        if msgtype == MSGTYPE_HANDSHAKE_REQUEST:
+            session.key, session.device = options.credentials.get(message[8:72], (None, None))
+            session.established = False
+            if session.key is None:
+                print("No credentials for V3 session {} => {}, token {}".format(
+                    ip_address(src), ip_address(dst), message[8:72].hex()), file=sys.stderr)
+        elif msgtype == MSGTYPE_HANDSHAKE_RESPONSE:
+            # Derive the session key once per connection
+            if session.key is not None:
+                session.established = session.codec.handshake(message[8:72], session.key)
+        elif msgtype in (MSGTYPE_ENCRYPTED_REQUEST, MSGTYPE_ENCRYPTED_RESPONSE):
+            if not session.established or not in_range:
+                return
+            if options.devices and session.device is not None and session.device not in options.devices:
+                return
+
+            try:
+                packets, _ = session.codec.decode(message)
+            except ValueError:
+                # Bad signature or truncated message
+                return
+
+            yield from self._decode_packets(number, timestamp, src, dst, packets, message, 3)
+
+    def _decode_packets(self, number, timestamp, src, dst, packets, raw, protocol):
+        options = self._options
+
+        selected = []
+        for packet in packets:
+            packet = memoryview(packet)
 
-    print("\n### No.{0} {1} {2} => {3}".format(
-        packet.number, packet.sniff_time, packet.ip.src, packet.ip.dst))
-    if (not ipaddress.ip_address(packet.ip.src).is_private
-            or not ipaddress.ip_address(packet.ip.dst).is_private):
-        print("NOT LOCAL: packet to/from Midea Cloud")
-
-    print("Message Type:\t %s %s applianceId: -hex: %s -int: %d" %
-          (msg_type.upper(), hex(msg_type_hex), device_id, convert_device_id_int(device_id)))
-
-    if len(reply) >= 20:
-        response = appliance_response(reply)
-        print("Decoded Data:\t {}".format({
-            'power_state': response.power_state,
-            'operational_mode': get_operational_mode(response.operational_mode),
-            'target_temperature': response.target_temperature,
-            'fan_speed': get_fan_speed(response.fan_speed),
-            'swing_mode': response.swing_mode,
-            'eco_mode': response.eco_mode,
-            'turbo_mode': response.turbo_mode,
-            'indoor_temperature': response.indoor_temperature,
-            'outdoor_temperature': response.outdoor_temperature,
-        }))
+            # Only complete packets, whose header holds their length
+            if len(packet) < 56 or packet[:2] != codec.V2_MAGIC:
+                continue
+            if len(packet) != packet[4] | (packet[5] << 8):
+                continue
+
+            if options.devices and bytes(packet[20:26]) not in options.devices:
+                continue
+
+            if options.fiter_type not in ('all', 'error'):
+                if peek_type(self._cipher, packet[40:-16]) != options.fiter_type:
+                    continue
+
+            selected.append(packet)
+
+        # Decrypt all packets of the message with a single cipher call
+        replies = codec.decrypt_packets(selected)
+        for packet, reply in zip(selected, replies):
+            yield from self._decode_record(number, timestamp, src, dst, packet, reply, raw, protocol)
+
+    def _decode_record(self, number, timestamp, src, dst, packet, reply, raw, protocol):
+        options = self._options
+        device_id = packet[20:26].hex()
+
+        msg_type_hex = 255
+        msg_type = 'error'
+
+        if len(reply) >= 20:
+            msg_type_hex = reply[1]
+            msg_type = get_type(msg_type_hex)
+
+        if options.fiter_type != 'all':
+            if msg_type != options.fiter_type:
+                return
+
+        record = {
+            'number': number,
+            'time': timestamp,
+            'src': str(ip_address(src)),
+            'dst': str(ip_address(dst)),
+            'protocol': protocol,
+            'device_id': device_id,
+            'appliance_id': int.from_bytes(packet[20:26], 'little'),
+            'msg_type': msg_type,
+            'msg_type_hex': msg_type_hex,
+            'data': None,
+        }
+
+        state = codec.decode_state(reply) if len(reply) >= 20 else None
+        if state is not None:
+            record['data'] = {
+                'power_state': state['power_state'],
+                'operational_mode': get_operational_mode(state['operational_mode']),
+                'target_temperature': state['target_temperature'],
+                'fan_speed': get_fan_speed(state['fan_speed']),
+                'swing_mode': state['swing_mode'],
+                'eco_mode': state['eco_mode'],
+                'turbo_mode': state['turbo_mode'],
+                'indoor_temperature': state['indoor_temperature'],
+                'outdoor_temperature': state['outdoor_temperature'],
+            }
+
+        if options.tcp_raw:
+            record['tcp_raw'] = bytes(raw).hex()
+        if options.msg_raw:
+            record['msg_raw'] = reply.hex()
+
+        yield record
+
+
+def decode_packets(packets, options):
+    """Decrypt and decode the Midea messages among a stream of packets."""
+    decoder = Decoder(options)
+    for packet in packets:
+        yield from decoder.feed(*packet)
+
+
+def match_record(record, options) -> bool:
+    """Apply the command line filters to an already decoded record."""
+    if options.devices and bytes.fromhex(record['device_id']) not in options.devices:
+        return False
+    if record['time'] is not None:
+        if options.since is not None and record['time'] < options.since:
+            return False
+        if options.until is not None and record['time'] > options.until:
+            return False
+    if options.fiter_type != 'all' and record['msg_type'] != options.fiter_type:
+        return False
+    return True
+
+
+def format_record(record) -> str:
+    lines = []
+
+    if record['time'] is None:
+        sniff_time = "-"
+    else:
+        sniff_time = datetime.datetime.fromtimestamp(record['time'])
+
+    lines.append("\n### No.{0} {1} {2} => {3}".format(
+        record['number'], sniff_time, record['src'], record['dst']))
+    if (not ip_address(record['src']).is_private
+            or not ip_address(record['dst']).is_private):
+        lines.append("NOT LOCAL: packet to/from Midea Cloud")
+
+    device_id = record['device_id']
+    lines.append("Message Type:\t %s %s applianceId: -hex: %s -int: %d" %
+                 (record['msg_type'].upper(), hex(record['msg_type_hex']), device_id, convert_device_id_int(device_id)))
+
+    if record['data'] is not None:
+        lines.append("Decoded Data:\t {}".format(record['data']))
     else:
-         print("Decoded Data:\t Can't Decoded")
+        lines.append("Decoded Data:\t Can't Decoded")
+
+    if record.get('tcp_raw') is not None:
+        lines.append("TCP RAW:\t %s" % record['tcp_raw'])
+    if record.get('msg_raw') is not None:
+        lines.append("Message RAW:\t %s" % record['msg_raw'])
+
+    return "\n".join(lines)
+
+
+class Index:
+    """Sidecar index of an output file.
+
+    Records are written in blocks. For every block the index keeps its location
+    in the output and, per appliance, the time range and number of records, so
+    queries only read the blocks that can match.
+    """
+
+    def __init__(self, format: str):
+        self.format = format
+        self.blocks = []
+        self._devices = {}
+
+    def add(self, record) -> None:
+        device = self._devices.setdefault(record['device_id'], [record['time'], record['time'], 0])
+        time = record['time']
+        if time is not None:
+            device[0] = time if device[0] is None else min(device[0], time)
+            device[1] = time if device[1] is None else max(device[1], time)
+        device[2] += 1
+
+    def flush(self, location) -> None:
+        if self._devices:
+            self.blocks.append({'location': location, 'devices': self._devices})
+            self._devices = {}
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({'format': self.format, 'blocks': self.blocks}, f)
+
+    @staticmethod
+    def load(path: str):
+        with open(path) as f:
+            data = json.load(f)
+        index = Index(data['format'])
+        index.blocks = data['blocks']
+        return index
+
+    def search(self, options):
+        """Yield the locations of blocks that may hold matching records."""
+        devices = {d.hex() for d in options.devices} if options.devices else None
+        for block in self.blocks:
+            for device_id, (first, last, _) in block['devices'].items():
+                if devices is not None and device_id not in devices:
+                    continue
+                if options.since is not None and last is not None and last < options.since:
+                    continue
+                if options.until is not None and first is not None and first > options.until:
+                    continue
+                yield block['location']
+                break
+
+
+class TextWriter:
+    """Human readable output, as printed by earlier versions."""
+
+    def __init__(self, path: str = None):
+        self._file = open(path, "w") if path else sys.stdout
+
+    def write(self, record) -> None:
+        print(format_record(record), file=self._file)
+
+    def close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class JsonLinesWriter:
+    """One JSON object per decoded frame, indexed by byte offset."""
+
+    def __init__(self, path: str = None):
+        self._file = open(path, "wb") if path else sys.stdout.buffer
+        self._path = path
+        self._index = Index("jsonl") if path else None
+        self._block_start = 0
+        self._block_records = 0
+
+    def write(self, record) -> None:
+        self._file.write(json.dumps(record).encode() + b"\n")
+        if self._index is None:
+            return
+
+        self._index.add(record)
+        self._block_records += 1
+        if self._block_records >= INDEX_BLOCK_RECORDS:
+            self._flush_block()
+
+    def _flush_block(self) -> None:
+        offset = self._file.tell()
+        self._index.flush([self._block_start, offset - self._block_start])
+        self._block_start = offset
+        self._block_records = 0
+
+    def close(self) -> None:
+        if self._index is None:
+            self._file.flush()
+            return
+
+        self._flush_block()
+        self._file.close()
+        self._index.save(self._path + INDEX_SUFFIX)
+
+    @staticmethod
+    def read(path: str, locations):
+        with open(path, "rb") as f:
+            for offset, length in locations:
+                f.seek(offset)
+                for line in f.read(length).splitlines():
+                    yield json.loads(line)
+
+
+class ParquetWriter:
+    """Columnar output with one row group per index block, requires pyarrow."""
+
+    def __init__(self, path: str):
+        import pyarrow
+        import pyarrow.parquet
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            ('number', pyarrow.int64()),
+            ('time', pyarrow.float64()),
+            ('src', pyarrow.string()),
+            ('dst', pyarrow.string()),
+            ('protocol', pyarrow.int8()),
+            ('device_id', pyarrow.string()),
+            ('appliance_id', pyarrow.int64()),
+            ('msg_type', pyarrow.string()),
+            ('msg_type_hex', pyarrow.int16()),
+            ('power_state', pyarrow.bool_()),
+            ('operational_mode', pyarrow.string()),
+            ('target_temperature', pyarrow.float64()),
+            ('fan_speed', pyarrow.string()),
+            ('swing_mode', pyarrow.int16()),
+            ('eco_mode', pyarrow.bool_()),
+            ('turbo_mode', pyarrow.bool_()),
+            ('indoor_temperature', pyarrow.float64()),
+            ('outdoor_temperature', pyarrow.float64()),
+            ('tcp_raw', pyarrow.string()),
+            ('msg_raw', pyarrow.string()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._path = path
+        self._index = Index("parquet")
+        self._rows = []
+        self._row_groups = 0
+
+    def write(self, record) -> None:
+        row = {k: v for k, v in record.items() if k != 'data'}
+        row.update(record['data'] or {})
+        self._rows.append(row)
+        self._index.add(record)
+        if len(self._rows) >= INDEX_BLOCK_RECORDS:
+            self._flush_block()
+
+    def _flush_block(self) -> None:
+        if not self._rows:
+            return
+        table = self._pyarrow.Table.from_pylist(self._rows, schema=self._schema)
+        self._writer.write_table(table)
+        self._index.flush(self._row_groups)
+        self._row_groups += 1
+        self._rows = []
+
+    def close(self) -> None:
+        self._flush_block()
+        self._writer.close()
+        self._index.save(self._path + INDEX_SUFFIX)
+
+    @staticmethod
+    def read(path: str, locations):
+        import pyarrow.parquet
+
+        data_fields = ('power_state', 'operational_mode', 'target_temperature', 'fan_speed',
+                       'swing_mode', 'eco_mode', 'turbo_mode', 'indoor_temperature', 'outdoor_temperature')
+
+        parquet = pyarrow.parquet.ParquetFile(path)
+        for row_group in locations:
+            for row in parquet.read_row_group(row_group).to_pylist():
+                data = {k: row.pop(k) for k in data_fields}
+                row['data'] = None if row['msg_type'] == 'error' else data
+                yield row
+
+
+WRITERS = {
+    'text': TextWriter,
+    'jsonl': JsonLinesWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def decode_shard(path, shard, shards, options, queue):
+    """Decode the connections of one shard of a capture in a worker process."""
+    capture = Capture(path)
+    decoder = Decoder(options, shard, shards)
+    batch = []
+    try:
+        for packet in capture.packets():
+            for record in decoder.feed(*packet):
+                batch.append(record)
+                if len(batch) >= SHARD_BATCH_RECORDS:
+                    queue.put(batch)
+                    batch = []
+        queue.put(batch)
+    except Exception as e:
+        queue.put(e)
+    finally:
+        queue.put(None)
+        capture.close()
+
+
+def shard_records(queue):
+    while (batch := queue.get()) is not None:
+        if isinstance(batch, Exception):
+            raise batch
+        yield from batch
+
+
+def decode(args, writer):
+    if args.jobs == 1:
+        capture = Capture(args.pcapfile)
+        try:
+            for record in decode_packets(capture.packets(), args):
+                writer.write(record)
+        finally:
+            capture.close()
+        return
+
+    # Shard connections across processes, merging results back into capture order
+    queues = [multiprocessing.Queue(SHARD_QUEUE_BATCHES) for _ in range(args.jobs)]
+    workers = [multiprocessing.Process(target=decode_shard, args=(args.pcapfile, shard, args.jobs, args, queue),
+                                       daemon=True)
+               for shard, queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for record in heapq.merge(*map(shard_records, queues), key=lambda r: r['number']):
+            writer.write(record)
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+
+
+def query(args, writer):
+    """Read matching records back from an indexed output file."""
+    index = Index.load(args.query + INDEX_SUFFIX)
+    locations = index.search(args)
+    for record in WRITERS[index.format].read(args.query, locations):
+        if match_record(record, args):
+            writer.write(record)
+
+
+def parse_device(value: str) -> bytes:
+    """Convert an appliance id, decimal or 0x prefixed hex, to its packet header bytes."""
+    return int(value, 0).to_bytes(6, "little")
+
+
+def parse_credentials(pairs, path: str = None) -> dict:
+    """Map V3 tokens to the k1 and packet header id of their device."""
+    devices = [dict(zip(("token", "k1"), pair.split(":", 1))) for pair in pairs]
+    if path:
+        with open(path) as f:
+            devices += json.load(f)
+
+    credentials = {}
+    for device in devices:
+        if not device.get("token") or not device.get("k1"):
+            continue
+        id = device.get("id")
+        header_id = int(id).to_bytes(6, "little") if id else None
+        credentials[bytes.fromhex(device["token"])] = (bytes.fromhex(device["k1"]), header_id)
+    return credentials
+
+
+def parse_time(value: str) -> float:
+    """Parse a time as seconds since the epoch or an ISO 8601 date."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def main(args):
+    if args.format == 'parquet' and not args.output:
+        raise SystemExit("Parquet output requires --output")
+
+    writer = WRITERS[args.format](args.output)
+    try:
+        if args.query:
+            query(args, writer)
+        else:
+            decode(args, writer)
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Decipher Midea's Msmart local binary protocol from "
+            "Wireshark / pcap-ng captures"))
+    parser.add_argument("pcapfile", type=str, nargs='?', help="path to pcap or pcapng dump")
+
+    parser.add_argument('-f', "--fiter_type", type=str, dest="fiter_type", help='fliter type from midea message',
+                        default='all', choices=['all', 'get', 'reply', 'set', 'unknown', 'error'])
+    parser.add_argument('-d', "--device", type=parse_device, dest="devices", action='append',
+                        help='only messages of this appliance id, may be repeated')
+    parser.add_argument("--since", type=parse_time,
+                        help='only messages at or after this time, epoch seconds or ISO 8601')
+    parser.add_argument("--until", type=parse_time,
+                        help='only messages at or before this time, epoch seconds or ISO 8601')
+    parser.add_argument('-k', "--credentials", type=str, action='append', default=[],
+                        help='token and k1 of a V3 device as TOKEN:K1, may be repeated')
+    parser.add_argument("--credentials-file", type=str,
+                        help='JSON list of devices with token, k1 and optionally id, like config entry data')
+    parser.add_argument("--tcp-raw", action='store_true')
+    parser.add_argument("--msg-raw", action='store_true')
+    parser.add_argument('-j', "--jobs", type=int, default=1,
+                        help='number of processes decoding the capture, 0 for one per core')
+    parser.add_argument('-F', "--format", type=str, default='text', choices=list(WRITERS),
+                        help='output format, jsonl and parquet files get an index for --query')
+    parser.add_argument('-o', "--output", type=str,
+                        help='write to this file instead of stdout')
+    parser.add_argument('-q', "--query", type=str,
+                        help='read records from an indexed jsonl or parquet output instead of a capture')
+    args = parser.parse_args()
+
+    if not args.pcapfile and not args.query:
+        parser.error("a pcapfile or --query is required")
+
+    if args.jobs <= 0:
+        args.jobs = multiprocessing.cpu_count()
+
+    args.devices = set(args.devices) if args.devices else None
+    args.credentials = parse_credentials(args.credentials, args.credentials_file)
 
-    if args.tcp_raw:
-        print("TCP RAW:\t %s" % tcp_data)
-    if args.msg_raw:
-        print("Message RAW:\t %s" % reply.hex())
+    try:
+        main(args)
+    except BrokenPipeError:
+        sys.stderr.close()